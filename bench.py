@@ -0,0 +1,287 @@
+"""Benchmark suite for level loading, simulation and drawing.
+
+Generates synthetic TMX maps at graded tile counts and trap densities, drives
+each one headless with a scripted input pattern and writes load time, per-phase
+frame time percentiles and peak memory to a JSON file so runs can be compared
+across commits:
+
+    python bench.py --sizes 1000 10000 --densities sparse --frames 600
+
+Each scenario runs in a fresh interpreter so caches start cold and the peak
+memory reading belongs to that scenario alone.
+"""
+import argparse
+import json
+import os
+import platform
+import random
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+from os.path import abspath, dirname, join
+
+ROOT = dirname(abspath(__file__))
+
+DEFAULT_SIZES = (1000, 10000, 100000)
+# Objects of each kind (traps, spikes, boxes) per 1000 tiles
+DENSITIES = {"none": 0, "sparse": 5, "dense": 50}
+
+MAP_ROWS = 16
+GROUND_ROWS = 4
+TILE = 48
+# Terrain.png is 352x176: 7 columns x 3 rows of 48px tiles
+TERRAIN_COLUMNS = 7
+TERRAIN_TILECOUNT = 21
+GROUND_GID = 3
+
+
+def generate_tmx(path, tiles, density="sparse", seed=0):
+    """Write a TMX map with about `tiles` solid tiles and `density` objects.
+
+    The bottom GROUND_ROWS rows are solid ground with random pits, spikes,
+    traps and boxes sit on top of it, checkpoints are spread along the way and
+    the End object is near the right edge.
+    """
+    rng = random.Random(seed)
+    width = max(32, tiles // GROUND_ROWS)
+    per_kind = round(DENSITIES[density] * tiles / 1000)
+    ground_top = MAP_ROWS - GROUND_ROWS
+
+    grid = [[0] * width for _ in range(MAP_ROWS)]
+    for y in range(ground_top, MAP_ROWS):
+        for x in range(width):
+            grid[y][x] = GROUND_GID
+
+    def spot():
+        # Ground x positions past the spawn area
+        return rng.randrange(8, width - 4) * TILE
+
+    surface_y = ground_top * TILE
+    objects = [("player", 2 * TILE, surface_y - TILE, TILE, TILE, {})]
+    for _ in range(per_kind):
+        # Disappearing trap floating just above the ground
+        objects.append(("trap", spot(), surface_y - 3 * TILE, TILE, TILE, {}))
+    for i in range(per_kind):
+        props = {"hidden": "true"} if i % 2 else {}
+        objects.append(("spike", spot(), surface_y - TILE, TILE, TILE, props))
+    for _ in range(per_kind):
+        objects.append(("box2", spot(), surface_y - TILE, TILE, TILE, {}))
+    for _ in range(max(1, per_kind // 10)):
+        objects.append(("checkpoint", spot(), surface_y - 64, 64, 64, {}))
+    objects.append(("end", (width - 3) * TILE, surface_y - 64, 64, 64, {}))
+
+    terrain = join(ROOT, "assets", "Terrain", "Terrain.png")
+    lines = [
+        '<?xml version="1.0" encoding="UTF-8"?>',
+        f'<map version="1.10" orientation="orthogonal" renderorder="right-down" width="{width}" '
+        f'height="{MAP_ROWS}" tilewidth="{TILE}" tileheight="{TILE}" infinite="0" '
+        f'nextlayerid="3" nextobjectid="{len(objects) + 1}">',
+        f' <tileset firstgid="1" name="Terrain" tilewidth="{TILE}" tileheight="{TILE}" '
+        f'tilecount="{TERRAIN_TILECOUNT}" columns="{TERRAIN_COLUMNS}">',
+        f'  <image source="{terrain}" width="352" height="176"/>',
+        ' </tileset>',
+        f' <layer id="1" name="ground" width="{width}" height="{MAP_ROWS}">',
+        '  <data encoding="csv">',
+        ",\n".join(",".join(str(gid) for gid in row) for row in grid),
+        '</data>',
+        ' </layer>',
+        ' <objectgroup id="2" name="Objects">',
+    ]
+    for obj_id, (name, x, y, w, h, props) in enumerate(objects, start=1):
+        lines.append(f'  <object id="{obj_id}" name="{name}" x="{x}" y="{y}" width="{w}" height="{h}">')
+        if props:
+            lines.append('   <properties>')
+            for key, value in props.items():
+                lines.append(f'    <property name="{key}" value="{value}"/>')
+            lines.append('   </properties>')
+        lines.append('  </object>')
+    lines += [' </objectgroup>', '</map>', '']
+    with open(path, "w", encoding="utf-8") as f:
+        f.write("\n".join(lines))
+    return {"width": width, "tiles": width * GROUND_ROWS, "objects": len(objects)}
+
+
+def scripted_input(main, tick):
+    # Run right, hop regularly and back off now and then
+    phase = tick % 240
+    bits = main.INPUT_RIGHT if phase < 200 else (main.INPUT_LEFT if phase >= 225 else 0)
+    if tick % 40 == 0:
+        bits |= main.INPUT_JUMP
+    return bits
+
+
+def percentiles(samples):
+    if not samples:
+        return {}
+    ordered = sorted(samples)
+    last = len(ordered) - 1
+
+    def pick(q):
+        return ordered[min(last, int(round(q * last)))] * 1000.0
+
+    return {
+        "mean_ms": sum(ordered) / len(ordered) * 1000.0,
+        "p50_ms": pick(0.50),
+        "p90_ms": pick(0.90),
+        "p99_ms": pick(0.99),
+        "max_ms": ordered[-1] * 1000.0,
+        "calls": len(ordered),
+    }
+
+
+class PhaseTimer:
+    """Wraps functions on a module or class so each call is timed under a phase name."""
+
+    def __init__(self):
+        self.samples = {}
+        self._restore = []
+
+    def wrap(self, owner, attr, phase):
+        original = getattr(owner, attr)
+        samples = self.samples.setdefault(phase, [])
+        clock = time.perf_counter
+
+        def timed(*args, **kwargs):
+            start = clock()
+            try:
+                return original(*args, **kwargs)
+            finally:
+                samples.append(clock() - start)
+
+        setattr(owner, attr, timed)
+        self._restore.append((owner, attr, original))
+
+    def unwrap(self):
+        for owner, attr, original in reversed(self._restore):
+            setattr(owner, attr, original)
+        self._restore.clear()
+
+
+def run_scenario(map_path, frames):
+    """Load and play one map in this process; returns the scenario metrics."""
+    os.environ["PLATFORMER_HEADLESS"] = "1"
+    sys.path.insert(0, ROOT)
+    os.chdir(ROOT)
+    import main
+
+    tracemalloc.start()
+    started = time.perf_counter()
+    level = main.load_tmx_level(map_path, 96)
+    load_s = time.perf_counter() - started
+    _, load_peak = tracemalloc.get_traced_memory()
+    object_count = len(level.objects)
+    del level
+
+    session = main.GameSession(main.get_window(), map_path)
+    timer = PhaseTimer()
+    timer.wrap(main.Player, "loop", "player_loop")
+    timer.wrap(main.Level, "update", "object_update")
+    timer.wrap(main, "handle_move", "handle_move")
+    timer.wrap(main, "handle_vertical_collision", "vertical_collision")
+    timer.wrap(main, "draw", "draw")
+    timer.wrap(session, "step_input", "step")
+    timer.wrap(session, "render", "render")
+    try:
+        run_started = time.perf_counter()
+        for tick in range(frames):
+            bits = scripted_input(main, tick)
+            if session.respawn_due():
+                bits |= main.INPUT_RESPAWN
+            session.step_input(bits)
+            session.render(1.0)
+        run_s = time.perf_counter() - run_started
+    finally:
+        timer.unwrap()
+    _, run_peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    return {
+        "load_s": load_s,
+        "objects": object_count,
+        "frames": frames,
+        "run_s": run_s,
+        "frames_per_s": frames / run_s if run_s > 0 else None,
+        "deaths": session.death_count,
+        "final_x": session.player.rect.x,
+        "phases": {phase: percentiles(samples) for phase, samples in timer.samples.items()},
+        "peak_python_bytes": max(load_peak, run_peak),
+        # ru_maxrss is KiB on Linux, bytes on macOS
+        "peak_rss_kib": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss // (1024 if sys.platform == "darwin" else 1),
+        "asset_cache": main.ASSETS.stats(),
+    }
+
+
+def _git_commit():
+    try:
+        out = subprocess.run(["git", "rev-parse", "HEAD"], cwd=ROOT, capture_output=True, text=True, timeout=10)
+        return out.stdout.strip() or None
+    except Exception:
+        return None
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark level load, simulation and drawing")
+    parser.add_argument("--sizes", type=int, nargs="+", default=list(DEFAULT_SIZES),
+                        help="tile counts of the generated maps")
+    parser.add_argument("--densities", nargs="+", default=["none", "sparse", "dense"], choices=sorted(DENSITIES),
+                        help="trap/spike/box density levels")
+    parser.add_argument("--frames", type=int, default=600, help="ticks to simulate per scenario")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", default="bench_results.json", help="where to write the JSON results")
+    parser.add_argument("--maps-dir", help="keep generated maps here instead of a temp dir")
+    parser.add_argument("--run-one", nargs=3, metavar=("MAP", "FRAMES", "OUT"), help=argparse.SUPPRESS)
+    args = parser.parse_args(argv)
+
+    if args.run_one:
+        map_path, frames, out = args.run_one
+        result = run_scenario(map_path, int(frames))
+        with open(out, "w") as f:
+            json.dump(result, f)
+        return 0
+
+    maps_dir = args.maps_dir or tempfile.mkdtemp(prefix="platformer-bench-")
+    os.makedirs(maps_dir, exist_ok=True)
+    scenarios = []
+    for size in args.sizes:
+        for density in args.densities:
+            name = f"{size}-{density}"
+            map_path = join(maps_dir, f"bench_{name}.tmx")
+            layout = generate_tmx(map_path, size, density, seed=args.seed)
+            out_path = join(maps_dir, f"bench_{name}.json")
+            cmd = [sys.executable, abspath(__file__), "--run-one", map_path, str(args.frames), out_path]
+            proc = subprocess.run(cmd, capture_output=True, text=True)
+            if proc.returncode != 0:
+                print(f"{name}: failed\n{proc.stderr}", file=sys.stderr)
+                scenarios.append({"name": name, "size": size, "density": density, **layout,
+                                  "error": proc.stderr.strip().splitlines()[-1:] or ["unknown"]})
+                continue
+            with open(out_path) as f:
+                result = json.load(f)
+            scenarios.append({"name": name, "size": size, "density": density, **layout, **result})
+            step = result["phases"].get("step", {})
+            render = result["phases"].get("render", {})
+            print(f"{name:>14}: load {result['load_s'] * 1000:8.1f} ms | "
+                  f"step p50 {step.get('p50_ms', 0):6.3f} p99 {step.get('p99_ms', 0):6.3f} ms | "
+                  f"render p50 {render.get('p50_ms', 0):6.3f} p99 {render.get('p99_ms', 0):6.3f} ms | "
+                  f"rss {result['peak_rss_kib'] / 1024:7.1f} MiB")
+
+    report = {
+        "commit": _git_commit(),
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "frames": args.frames,
+        "seed": args.seed,
+        "scenarios": scenarios,
+    }
+    with open(args.output, "w") as f:
+        json.dump(report, f, indent=2)
+    print(f"Wrote {args.output}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,27 +1,400 @@
 import os
-import random
-import math
-import pygame
-from os import listdir
-from os.path import isfile, join
-try:
-    from pytmx.util_pygame import load_pygame as load_tmx
-    _PYTMX_AVAILABLE = True
-except Exception:
-    _PYTMX_AVAILABLE = False
-pygame.init()
-
-pygame.display.set_caption("Platformer")
+import sys
+import time
+
+# Reference point for the startup timings reported at the first frame
+_STARTED = time.perf_counter()
+
+import random  # noqa: E402
+import math  # noqa: E402
+import struct  # noqa: E402
+import csv  # noqa: E402
+import hashlib  # noqa: E402
+import pickle  # noqa: E402
+import queue  # noqa: E402
+import sqlite3  # noqa: E402
+import threading  # noqa: E402
+from array import array  # noqa: E402
+from xml.etree import ElementTree  # noqa: E402
+from types import SimpleNamespace  # noqa: E402
+
+# Headless mode renders nowhere: SDL's dummy driver must be chosen before init
+HEADLESS = os.environ.get("PLATFORMER_HEADLESS", "") not in ("", "0") or (
+        __name__ == "__main__" and "--headless" in sys.argv[1:])
+if HEADLESS:
+    for _var in ("SDL_VIDEODRIVER", "SDL_AUDIODRIVER"):
+        if not os.environ.get(_var):
+            os.environ[_var] = "dummy"
+
+import pygame  # noqa: E402
+from collections import namedtuple, OrderedDict, deque  # noqa: E402
+from os import listdir  # noqa: E402
+from os.path import isfile, join  # noqa: E402
 
 WIDTH, HEIGHT = 1000, 800
 FPS = 60
 PLAYER_VEL = 5
+# Simulation runs at a fixed FPS ticks per second; rendering is decoupled
+SIM_DT_MS = 1000 / FPS
+MAX_RENDER_FPS = 240
+# Longest wall-clock frame fed into the simulation accumulator
+MAX_FRAME_TIME_MS = 250
+# Extra pixels around the viewport still treated as visible by culling
+CULL_MARGIN = 128
+# Maps wider than this many pixels are streamed in around the camera
+STREAM_MIN_WIDTH = 32768
 
-window = pygame.display.set_mode((WIDTH, HEIGHT))
+# Created by get_window(); importing this module opens no window
+window = None
+# Milliseconds since import for each startup milestone, see startup_mark()
+STARTUP_MS = {}
 
 
-def flip(sprites):
-    return [pygame.transform.flip(sprite, True, False) for sprite in sprites]
+def startup_mark(name):
+    # Only the first occurrence of a milestone counts
+    if name not in STARTUP_MS:
+        STARTUP_MS[name] = (time.perf_counter() - _STARTED) * 1000.0
+
+
+startup_mark("import")
+
+
+def get_window():
+    """The game window, initialising pygame and opening the display on first use."""
+    global window
+    if window is None:
+        pygame.init()
+        pygame.display.set_caption("Platformer")
+        window = pygame.display.set_mode((WIDTH, HEIGHT))
+        startup_mark("display")
+    return window
+
+
+_pytmx = None
+
+
+def import_pytmx():
+    """pytmx, imported on first use; None if it is not installed."""
+    global _pytmx
+    if _pytmx is None:
+        try:
+            import pytmx
+            import pytmx.util_pygame
+            _pytmx = pytmx
+        except Exception:
+            _pytmx = False
+    return _pytmx or None
+
+
+class RealClock:
+    def get_ticks(self):
+        return pygame.time.get_ticks()
+
+
+class SimClock:
+    """Virtual millisecond clock that only moves when the simulation advances it."""
+
+    def __init__(self, start_ms=0):
+        self.ms = start_ms
+
+    def advance(self, ms):
+        self.ms += ms
+
+    def get_ticks(self):
+        return int(self.ms)
+
+
+_clock = RealClock()
+
+
+def set_clock(clock):
+    # Every timed behaviour reads get_ticks(), so this swaps the game's time source
+    global _clock
+    _clock = clock
+
+
+def get_ticks():
+    return _clock.get_ticks()
+
+
+# An animation frame: the surface to blit and its precomputed collision mask
+Frame = namedtuple("Frame", ["image", "mask"])
+
+
+def make_frame(surface):
+    return Frame(surface, pygame.mask.from_surface(surface))
+
+
+_EMPTY_FRAMES = {}
+
+
+def empty_frame(width, height):
+    # Shared fully transparent frame for hidden, broken or vanished objects
+    frame = _EMPTY_FRAMES.get((width, height))
+    if frame is None:
+        frame = make_frame(pygame.Surface((width, height), pygame.SRCALPHA))
+        _EMPTY_FRAMES[(width, height)] = frame
+    return frame
+
+
+class LRUCache:
+    """Mapping of at most max_entries, evicting the least recently used entry."""
+
+    def __init__(self, max_entries):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key):
+        """Return the entry for key, or None (counted as a miss)."""
+        entry = self._entries.get(key)
+        if entry is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        self._entries.move_to_end(key)
+        return entry
+
+    def put(self, key, entry):
+        self._entries[key] = entry
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def items(self):
+        return self._entries.items()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def clear(self):
+        self._entries.clear()
+
+
+class AssetCache:
+    """Process-wide cache of loaded images, their scaled/flipped variants and masks.
+
+    Entries are keyed by (path, sub-rect, scale, flip) and shared between every
+    object asking for the same asset. The least recently used entries are
+    evicted once more than max_entries are held.
+
+    With an atlas loaded (load_atlas), every variant built on an earlier run is
+    a subsurface of a few packed atlas pages instead of being loaded, cut,
+    scaled and flipped again. save_atlas() writes the atlas back whenever new
+    variants were built.
+    """
+    MAX_ENTRIES = 1024
+    ATLAS_PAGE_SIZE = 2048
+    ATLAS_MAGIC = b"UPAT"
+    ATLAS_VERSION = 1
+    # magic, format version, page count
+    _ATLAS_HEADER = struct.Struct("<4sHH")
+
+    def __init__(self, max_entries=MAX_ENTRIES, atlas_dir=None):
+        # key -> [surface, mask or None]
+        self._entries = LRUCache(max_entries)
+        # key -> (page index, x, y, w, h) of variants packed in the atlas
+        self._atlas = {}
+        self._atlas_pages = []
+        # Loaded together with the first asset, not at construction
+        self._atlas_dir = atlas_dir
+        self._atlas_pending = atlas_dir is not None
+        # Variants built since the atlas was loaded
+        self.atlas_stale = False
+
+    def _entry(self, path, rect, scale, flip):
+        key = (path, tuple(rect) if rect is not None else None, scale, flip)
+        entry = self._entries.get(key)
+        if entry is not None:
+            return entry
+        if self._atlas_pending:
+            self._atlas_pending = False
+            self.load_atlas(self._atlas_dir)
+        packed = self._atlas.get(key)
+        if packed is not None:
+            page, x, y, w, h = packed
+            surface = self._atlas_pages[page].subsurface((x, y, w, h))
+        else:
+            surface = self._build(path, rect, scale, flip)
+            self.atlas_stale = True
+        entry = [surface, None]
+        self._entries.put(key, entry)
+        return entry
+
+    def _build(self, path, rect, scale, flip):
+        # convert_alpha() needs the display
+        get_window()
+        if rect is None and scale is None and flip == (False, False):
+            return pygame.image.load(path).convert_alpha()
+        surface = self.image(path)
+        if rect is not None:
+            rect = pygame.Rect(rect)
+            sub = pygame.Surface(rect.size, pygame.SRCALPHA, 32)
+            sub.blit(surface, (0, 0), rect)
+            surface = sub
+        if scale == 2:
+            surface = pygame.transform.scale2x(surface)
+        elif isinstance(scale, int):
+            surface = pygame.transform.scale(surface, (surface.get_width() * scale, surface.get_height() * scale))
+        elif scale is not None:
+            surface = pygame.transform.smoothscale(surface, scale)
+        if flip != (False, False):
+            surface = pygame.transform.flip(surface, *flip)
+        return surface
+
+    def image(self, path, rect=None, scale=None, flip=(False, False)):
+        """Return the shared surface for path, cut to rect, then scaled and flipped.
+
+        scale is either an integer factor (2 uses scale2x) or a (width, height)
+        target size for smoothscale.
+        """
+        return self._entry(path, rect, scale, flip)[0]
+
+    def frame(self, path, rect=None, scale=None, flip=(False, False)):
+        entry = self._entry(path, rect, scale, flip)
+        if entry[1] is None:
+            entry[1] = pygame.mask.from_surface(entry[0])
+        return Frame(entry[0], entry[1])
+
+    def stats(self):
+        return {"entries": len(self._entries), "hits": self._entries.hits, "misses": self._entries.misses,
+                "atlas_frames": len(self._atlas), "atlas_pages": len(self._atlas_pages)}
+
+    def clear(self):
+        self._entries.clear()
+
+    def load_atlas(self, atlas_dir):
+        """Serve variants from the atlas in atlas_dir; False if there is none or it is out of date."""
+        self._atlas_dir = atlas_dir
+        self._atlas_pending = False
+        self._atlas = {}
+        self._atlas_pages = []
+        try:
+            with open(join(atlas_dir, "index.bin"), "rb") as f:
+                blob = f.read()
+            magic, version, page_count = self._ATLAS_HEADER.unpack_from(blob)
+            if magic != self.ATLAS_MAGIC or version != self.ATLAS_VERSION:
+                return False
+            index = pickle.loads(memoryview(blob)[self._ATLAS_HEADER.size:])
+            # Any changed source image invalidates the whole atlas
+            for source, mtime_ns in index["sources"].items():
+                if os.stat(source).st_mtime_ns != mtime_ns:
+                    return False
+            pages = []
+            get_window()
+            for name, size in index["pages"]:
+                # Raw RGBA: no PNG decoding on the startup path
+                with open(join(atlas_dir, name), "rb") as f:
+                    pages.append(pygame.image.frombuffer(f.read(), size, "RGBA").convert_alpha())
+        except (OSError, ValueError, struct.error, pickle.UnpicklingError, KeyError, pygame.error):
+            return False
+        if len(pages) != page_count:
+            return False
+        self._atlas = index["frames"]
+        self._atlas_pages = pages
+        return True
+
+    def save_atlas(self, atlas_dir=None):
+        """Pack every variant built so far (and everything already in the atlas) into atlas pages."""
+        atlas_dir = atlas_dir or self._atlas_dir
+        surfaces = {key: entry[0] for key, entry in self._entries.items()}
+        for key, (page, x, y, w, h) in self._atlas.items():
+            if key not in surfaces:
+                surfaces[key] = self._atlas_pages[page].subsurface((x, y, w, h))
+
+        # Shelf packing, tallest first
+        page_size = self.ATLAS_PAGE_SIZE
+        frames = {}
+        page_extents = []
+        x = y = shelf_h = 0
+        for key in sorted(surfaces, key=lambda k: (-surfaces[k].get_height(), -surfaces[k].get_width())):
+            w, h = surfaces[key].get_size()
+            if x + w > page_size:
+                x, y, shelf_h = 0, y + shelf_h, 0
+            if not page_extents or y + h > page_size:
+                page_extents.append([0, 0])
+                x = y = shelf_h = 0
+            frames[key] = (len(page_extents) - 1, x, y, w, h)
+            extent = page_extents[-1]
+            extent[0] = max(extent[0], x + w)
+            extent[1] = max(extent[1], y + h)
+            x += w
+            shelf_h = max(shelf_h, h)
+
+        pages = [pygame.Surface((max(1, w), max(1, h)), pygame.SRCALPHA, 32) for w, h in page_extents]
+        for key, (page, x, y, w, h) in frames.items():
+            pages[page].blit(surfaces[key], (x, y))
+
+        os.makedirs(atlas_dir, exist_ok=True)
+        # Fresh page names per build, so an index never points at pages of another build
+        token = hashlib.sha1(repr(sorted(frames.items(), key=repr)).encode("utf-8")).hexdigest()[:10]
+        page_names = [f"page-{token}-{i}.rgba" for i in range(len(pages))]
+        for surface, name in zip(pages, page_names):
+            with open(join(atlas_dir, name), "wb") as f:
+                f.write(pygame.image.tobytes(surface, "RGBA"))
+        sources = {key[0]: os.stat(key[0]).st_mtime_ns for key in frames}
+        tmp_path = join(atlas_dir, f"index.bin.{os.getpid()}.tmp")
+        with open(tmp_path, "wb") as f:
+            f.write(self._ATLAS_HEADER.pack(self.ATLAS_MAGIC, self.ATLAS_VERSION, len(pages)))
+            f.write(pickle.dumps({"frames": frames, "pages": list(zip(page_names, [p.get_size() for p in pages])),
+                                  "sources": sources}, protocol=pickle.HIGHEST_PROTOCOL))
+        os.replace(tmp_path, join(atlas_dir, "index.bin"))
+        for name in listdir(atlas_dir):
+            if name.startswith("page-") and name not in page_names:
+                os.remove(join(atlas_dir, name))
+
+        self._atlas_dir = atlas_dir
+        self._atlas = frames
+        self._atlas_pages = [page.convert_alpha() for page in pages]
+        self.atlas_stale = False
+
+
+ATLAS_DIR = join(".cache", "atlas")
+ASSETS = AssetCache(atlas_dir=ATLAS_DIR)
+
+
+class TextCache:
+    """Fonts, rendered strings and prebuilt overlays, kept between frames.
+
+    Fonts are created once per (name, size). Rendered text is keyed by
+    content, font, size and colours, and overlays by whatever state they show,
+    so a string or overlay is only rebuilt when that changes. The least
+    recently used entries are evicted once more than max_entries are held.
+    """
+    MAX_ENTRIES = 256
+
+    def __init__(self, max_entries=MAX_ENTRIES):
+        self._fonts = {}
+        self._entries = LRUCache(max_entries)
+
+    def font(self, size, name=None):
+        font = self._fonts.get((name, size))
+        if font is None:
+            font = pygame.font.SysFont(name, size)
+            self._fonts[(name, size)] = font
+        return font
+
+    def cached(self, key, build):
+        """Return the entry for key, calling build() to create it on a miss."""
+        entry = self._entries.get(key)
+        if entry is None:
+            entry = build()
+            self._entries.put(key, entry)
+        return entry
+
+    def render(self, text, size, color=(255, 255, 255), background=None, font_name=None):
+        return self.cached(("text", text, font_name, size, color, background),
+                           lambda: self.font(size, font_name).render(text, True, color, background))
+
+    def stats(self):
+        return {"entries": len(self._entries), "fonts": len(self._fonts),
+                "hits": self._entries.hits, "misses": self._entries.misses}
+
+    def clear(self):
+        self._entries.clear()
+
+
+TEXT = TextCache()
 
 
 def load_sprite_sheets(dir1, dir2, width, height, direction=False):
@@ -31,45 +404,414 @@ def load_sprite_sheets(dir1, dir2, width, height, direction=False):
     all_sprites = {}
 
     for image in images:
-        sprite_sheet = pygame.image.load(join(path, image)).convert_alpha()
+        sheet_path = join(path, image)
+        sprite_sheet = ASSETS.image(sheet_path)
 
-        sprites = []
-        for i in range(sprite_sheet.get_width() // width):
-            surface = pygame.Surface((width, height), pygame.SRCALPHA, 32)
-            rect = pygame.Rect(i * width, 0, width, height)
-            surface.blit(sprite_sheet, (0, 0), rect)
-            sprites.append(pygame.transform.scale2x(surface))
+        rects = [(i * width, 0, width, height) for i in range(sprite_sheet.get_width() // width)]
+        sprites = [ASSETS.frame(sheet_path, rect, 2) for rect in rects]
 
         if direction:
             all_sprites[image.replace(".png", "") + "_right"] = sprites
-            all_sprites[image.replace(".png", "") + "_left"] = flip(sprites)
+            all_sprites[image.replace(".png", "") + "_left"] = [
+                ASSETS.frame(sheet_path, rect, 2, (True, False)) for rect in rects]
         else:
             all_sprites[image.replace(".png", "")] = sprites
 
     return all_sprites
 
 
-def get_block(size):
+_BLOCK_FRAMES = {}
+
+
+def get_block_frame(size, height=None):
+    """Frame of the size x size terrain block, on a size x height canvas if height is given.
+
+    A taller canvas leaves the block's bottom transparent, a shorter one
+    crops it.
+    """
     path = join("assets", "Terrain", "Terrain.png")
-    image = pygame.image.load(path).convert_alpha()
-    surface = pygame.Surface((size, size), pygame.SRCALPHA, 32)
-    rect = pygame.Rect(96, 0, size, size)
-    surface.blit(image, (0, 0), rect)
-    return surface
+    if height is None or height == size:
+        return ASSETS.frame(path, (96, 0, size, size))
+    frame = _BLOCK_FRAMES.get((size, height))
+    if frame is None:
+        image = pygame.Surface((size, height), pygame.SRCALPHA)
+        image.blit(ASSETS.image(path, (96, 0, size, size)), (0, 0))
+        frame = _BLOCK_FRAMES[(size, height)] = make_frame(image)
+    return frame
+
+
+def get_block(size):
+    return get_block_frame(size).image
+
+
+class SpatialHash:
+    """Uniform grid over world space used as the collision broadphase.
+
+    Objects are bucketed by every cell their rect overlaps, so a query only
+    visits the cells around the given rect instead of the whole level.
+    Several hashes can share one order dict so that they all return objects in
+    the same (level) order, however often an object leaves and rejoins one.
+    """
+    CELL_SIZE = 128
+
+    def __init__(self, cell_size=CELL_SIZE, order=None):
+        self.cell_size = cell_size
+        self.cells = {}
+        # obj -> (cell keys, rect tuple at insert time)
+        self._entries = {}
+        # obj -> first insertion index, keeps query results in level order
+        self._order = order if order is not None else {}
+        # Reused by every query, see query()
+        self._result = []
+        self._seen = set()
+
+    def _cell_keys(self, rect):
+        cs = self.cell_size
+        left, top, width, height = rect
+        x0 = left // cs
+        y0 = top // cs
+        x1 = (left + (width if width > 1 else 1) - 1) // cs
+        y1 = (top + (height if height > 1 else 1) - 1) // cs
+        if x0 == x1 and y0 == y1:
+            return [(x0, y0)]
+        return [(cx, cy) for cx in range(x0, x1 + 1) for cy in range(y0, y1 + 1)]
+
+    def insert(self, obj):
+        if obj in self._entries:
+            return
+        keys = self._cell_keys(obj.rect)
+        for key in keys:
+            self.cells.setdefault(key, []).append(obj)
+        self._entries[obj] = (keys, tuple(obj.rect))
+        self._order.setdefault(obj, len(self._order))
+
+    def remove(self, obj):
+        entry = self._entries.pop(obj, None)
+        if entry is None:
+            return
+        for key in entry[0]:
+            bucket = self.cells.get(key)
+            if bucket is not None:
+                bucket.remove(obj)
+                if not bucket:
+                    del self.cells[key]
+
+    def __contains__(self, obj):
+        return obj in self._entries
+
+    def update(self, obj):
+        # Re-bucket an object whose rect moved or was resized
+        entry = self._entries.get(obj)
+        if entry is None or entry[1] == tuple(obj.rect):
+            return
+        self.remove(obj)
+        self.insert(obj)
+
+    def query(self, rect):
+        """Objects in the cells rect overlaps, in level order.
+
+        The returned list is reused by the next query on this hash, so use it
+        up (or copy it) before querying again.
+        """
+        result = self._result
+        result.clear()
+        if not self.cells:
+            return result
+        keys = self._cell_keys(rect)
+        if len(keys) == 1:
+            # One bucket holds each object once
+            bucket = self.cells.get(keys[0])
+            if bucket:
+                result.extend(bucket)
+        else:
+            seen = self._seen
+            seen.clear()
+            for key in keys:
+                bucket = self.cells.get(key)
+                if bucket:
+                    for obj in bucket:
+                        if obj not in seen:
+                            seen.add(obj)
+                            result.append(obj)
+        result.sort(key=self._order.__getitem__)
+        return result
+
+
+class TileChunks:
+    """Static tile layers pre-rendered into fixed-size chunk surfaces.
+
+    Tiles are composited once at load time; drawing only blits the chunks
+    overlapping the camera instead of every tile.
+    """
+    CHUNK_SIZE = 512
+
+    def __init__(self, chunk_size=CHUNK_SIZE):
+        self.chunk_size = chunk_size
+        self.chunks = {}
+
+    def add(self, image, x, y, columns=None):
+        # columns, if given, limits which chunk columns the image is drawn into
+        cs = self.chunk_size
+        w, h = image.get_size()
+        for cx in range(x // cs, (x + w - 1) // cs + 1):
+            if columns is not None and cx not in columns:
+                continue
+            for cy in range(y // cs, (y + h - 1) // cs + 1):
+                chunk = self.chunks.get((cx, cy))
+                if chunk is None:
+                    chunk = pygame.Surface((cs, cs), pygame.SRCALPHA).convert_alpha()
+                    self.chunks[(cx, cy)] = chunk
+                chunk.blit(image, (x - cx * cs, y - cy * cs))
+
+    def discard(self, columns):
+        # Free the surfaces of the given chunk columns
+        for key in [key for key in self.chunks if key[0] in columns]:
+            del self.chunks[key]
+
+    def draw(self, win, offset_x):
+        cs = self.chunk_size
+        win_w, win_h = win.get_size()
+        for cx in range(offset_x // cs, (offset_x + win_w - 1) // cs + 1):
+            for cy in range(0, (win_h - 1) // cs + 1):
+                chunk = self.chunks.get((cx, cy))
+                if chunk is not None:
+                    win.blit(chunk, (cx * cs - offset_x, cy * cs))
+
+
+class Scheduler:
+    """Set of objects that currently have time-dependent work.
+
+    Objects join through Object.wake() when triggered (or at level start if
+    already busy) and drop out as soon as is_active() reports them idle, so a
+    frame only updates the objects that actually change.
+    """
+
+    def __init__(self):
+        # dict used as an insertion-ordered set
+        self.active = {}
+
+    def add(self, obj):
+        self.active[obj] = None
+
+    def sync(self, objects):
+        self.active.clear()
+        for obj in objects:
+            if obj.is_active():
+                self.add(obj)
+
+    def run(self, camera, moved=None):
+        for obj in list(self.active):
+            # Purely visual animations are skipped while off-screen
+            if obj.animation_only and not camera.colliderect(obj.rect):
+                continue
+            obj.loop()
+            if moved is not None:
+                moved(obj)
+            if not obj.is_active():
+                del self.active[obj]
+
+
+class Level:
+    """A loaded level and its object registry.
+
+    Besides grid (every object, used for drawing) objects are partitioned at
+    load time by role: solids, hazards and triggers are spatial hashes of the
+    objects that currently block, hurt or react to being touched, and animated
+    and resettable list the objects with loop() and reset(). Hot loops query
+    only the partition they need. solids follows is_solid as it changes (see
+    Object.is_solid); all partitions return objects in level order.
+    """
+
+    def __init__(self, objects, player_spawn=None, map_path=None, chunks=None):
+        self.objects = objects
+        self.player_spawn = player_spawn
+        self.map_path = map_path
+        self.chunks = chunks
+        self.scheduler = Scheduler()
+        self.grid = SpatialHash()
+        order = self.grid._order
+        self.solids = SpatialHash(order=order)
+        self.hazards = SpatialHash(order=order)
+        self.triggers = SpatialHash(order=order)
+        for obj in objects:
+            self._add(obj)
+        self.animated = [obj for obj in objects if callable(getattr(obj, "loop", None))]
+        self.resettable = [obj for obj in objects if callable(getattr(obj, "reset", None))]
+        self.ends = [obj for obj in objects if isinstance(obj, End)]
+        self.scheduler.sync(self.animated)
+
+    def _add(self, obj):
+        self.grid.insert(obj)
+        if obj.is_solid:
+            self.solids.insert(obj)
+        if obj.hazard:
+            self.hazards.insert(obj)
+        if obj.touch_trigger:
+            self.triggers.insert(obj)
+        obj.registry = self
+        obj.scheduler = self.scheduler
+
+    def _remove(self, obj):
+        for index in (self.grid, self.solids, self.hazards, self.triggers):
+            index.remove(obj)
+
+    def solid_changed(self, obj):
+        # Called by Object.is_solid whenever it flips; objects out of the
+        # registry (see StreamingLevel) rejoin with their current state
+        if obj not in self.grid:
+            return
+        if obj.is_solid:
+            self.solids.insert(obj)
+        else:
+            self.solids.remove(obj)
+
+    def _moved(self, obj):
+        for index in (self.grid, self.solids, self.hazards, self.triggers):
+            index.update(obj)
+
+    def object_restored(self, obj):
+        """Re-file obj after its attributes were replaced wholesale, e.g. from a snapshot."""
+        self._moved(obj)
+        self.solid_changed(obj)
+
+    def update(self, camera):
+        # Advance active objects and re-bucket any whose rect changed
+        self.scheduler.run(camera, self._moved)
+
+    def reset(self):
+        # Put every dynamic object back into its initial state
+        for obj in self.resettable:
+            obj.reset()
+        self.scheduler.sync(self.animated)
+
+    def visible(self, camera):
+        # Objects overlapping the camera rect, in level order; baked tiles are
+        # drawn through their chunks, not one by one
+        return [obj for obj in self.grid.query(camera) if not obj.baked]
+
+
+class StreamingLevel(Level):
+    """A Level whose tiles and objects only exist near the camera.
+
+    The map is cut into vertical strips of STRIP_CHUNKS TileChunks columns.
+    stream() builds the strips within LOAD_MARGIN pixels of the camera and
+    evicts the ones further than EVICT_MARGIN away: their chunk surfaces and
+    tile colliders are freed and rebuilt from the decoded data on the way
+    back. Game objects are built the first time their strip loads and are
+    then kept, only leaving the registry while the strip is out, so a fallen
+    trap or a reached checkpoint is exactly as it was when its strip reloads
+    and Level.reset() still resets every one of them. Queries return objects
+    in the same order as a fully built Level.
+    """
+    STRIP_CHUNKS = 2
+    LOAD_MARGIN = 512
+    EVICT_MARGIN = 2048
+
+    def __init__(self, builder, map_path=None):
+        super().__init__([], builder.player_spawn(), map_path, TileChunks())
+        self.builder = builder
+        self.strip_width = self.STRIP_CHUNKS * self.chunks.chunk_size
+        # strip -> indexes of the object records starting in it
+        self.strip_records = {}
+        for index, record in enumerate(builder.records):
+            self.strip_records.setdefault(int(record.x) // self.strip_width, []).append(index)
+        # record index -> its object (None if it has none), once built
+        self.built = {}
+        # strip -> (tile colliders, objects) currently in the registry
+        self.loaded = {}
+        self._window = None
+
+    def stream(self, camera):
+        """Load the strips around camera and evict the far ones."""
+        sw = self.strip_width
+        first = (camera.left - self.LOAD_MARGIN) // sw
+        last = (camera.right + self.LOAD_MARGIN - 1) // sw
+        if self._window == (first, last):
+            return
+        self._window = (first, last)
+        keep_first = (camera.left - self.EVICT_MARGIN) // sw
+        keep_last = (camera.right + self.EVICT_MARGIN - 1) // sw
+        for strip in [strip for strip in self.loaded if not keep_first <= strip <= keep_last]:
+            self._evict(strip)
+        for strip in range(first, last + 1):
+            if strip not in self.loaded:
+                self._load(strip)
+
+    def _load(self, strip):
+        order = self.grid._order
+        x0 = strip * self.strip_width
+        colliders = []
+        # Keys sort the same as a fully built level: tiles in map order, then objects
+        for row, column, collider in self.builder.tiles(self.chunks, x0, x0 + self.strip_width):
+            order[collider] = (0, row, column)
+            self._add(collider)
+            colliders.append(collider)
+        objects = []
+        for index in self.strip_records.get(strip, ()):
+            if index not in self.built:
+                self.built[index] = self._build_object(index)
+            obj = self.built[index]
+            if obj is not None:
+                order.setdefault(obj, (1, index))
+                self._add(obj)
+                objects.append(obj)
+        self.loaded[strip] = (colliders, objects)
+
+    def _build_object(self, index):
+        obj = self.builder.object(self.builder.records[index])
+        if obj is None:
+            return None
+        self.objects.append(obj)
+        if callable(getattr(obj, "loop", None)):
+            self.animated.append(obj)
+            if obj.is_active():
+                self.scheduler.add(obj)
+        if callable(getattr(obj, "reset", None)):
+            self.resettable.append(obj)
+        if isinstance(obj, End):
+            self.ends.append(obj)
+        return obj
+
+    def _evict(self, strip):
+        colliders, objects = self.loaded.pop(strip)
+        order = self.grid._order
+        for collider in colliders:
+            self._remove(collider)
+            del order[collider]
+        # Objects stay built (and scheduled, if busy) with their state intact
+        for obj in objects:
+            self._remove(obj)
+        self.chunks.discard(range(strip * self.STRIP_CHUNKS, (strip + 1) * self.STRIP_CHUNKS))
+
+    def update(self, camera):
+        self.stream(camera)
+        super().update(camera)
+
+    def visible(self, camera):
+        self.stream(camera)
+        return super().visible(camera)
+
+
+def camera_rect(offset_x, margin=CULL_MARGIN):
+    return pygame.Rect(offset_x - margin, -margin, WIDTH + margin * 2, HEIGHT + margin * 2)
 
 
 class Player(pygame.sprite.Sprite):
     COLOR = (255, 0, 0)
     GRAVITY = 1
-    SPRITES = load_sprite_sheets("MainCharacters", "MaskDude", 32, 32, True)
+    # Loaded by the first Player, not at import
+    SPRITES = None
     ANIMATION_DELAY = 3
 
     def __init__(self, x, y, width, height):
         super().__init__()
+        if Player.SPRITES is None:
+            Player.SPRITES = load_sprite_sheets("MainCharacters", "MaskDude", 32, 32, True)
         self.rect = pygame.Rect(x, y, width, height)
         self.x_vel = 0
         self.y_vel = 0
         self.mask = None
+        self.frame = None
         self.direction = "left"
         self.animation_count = 0
         self.fall_count = 0
@@ -78,6 +820,8 @@ class Player(pygame.sprite.Sprite):
         self.hit_count = 0
         # Last checkpoint respawn position
         self.respawn_pos = (x, y)
+        # Interpolated draw position, set by the renderer between ticks
+        self.render_pos = None
 
     def jump(self):
         self.y_vel = -self.GRAVITY * 8
@@ -145,16 +889,18 @@ class Player(pygame.sprite.Sprite):
         sprites = self.SPRITES[sprite_sheet_name]
         sprite_index = (self.animation_count //
                         self.ANIMATION_DELAY) % len(sprites)
-        self.sprite = sprites[sprite_index]
+        self.frame = sprites[sprite_index]
+        self.sprite = self.frame.image
         self.animation_count += 1
         self.update()
 
     def update(self):
         self.rect = self.sprite.get_rect(topleft=(self.rect.x, self.rect.y))
-        self.mask = pygame.mask.from_surface(self.sprite)
+        self.mask = self.frame.mask
 
     def draw(self, win, offset_x):
-        win.blit(self.sprite, (self.rect.x - offset_x, self.rect.y))
+        x, y = self.render_pos if self.render_pos is not None else self.rect.topleft
+        win.blit(self.sprite, (x - offset_x, y))
 
     def kill_player(self):
         self.make_hit()
@@ -172,14 +918,50 @@ class Player(pygame.sprite.Sprite):
 
 
 class Object(pygame.sprite.Sprite):
+    # True once the object's image lives in a pre-rendered TileChunks surface
+    baked = False
+    # True if loop() only advances visuals and can be skipped off-screen
+    animation_only = False
+    # Scheduler the object wakes itself into when it gets time-dependent work
+    scheduler = None
+    # Level whose registry partitions this object (see Level)
+    registry = None
+    # Roles: hurts the player on contact / reacts to being touched
+    hazard = False
+    touch_trigger = False
+    _solid = True
+
     def __init__(self, x, y, width, height, name=None):
         super().__init__()
         self.rect = pygame.Rect(x, y, width, height)
-        self.image = pygame.Surface((width, height), pygame.SRCALPHA)
+        # Blank until the subclass sets its own frame
+        self.set_frame(empty_frame(width, height))
         self.width = width
         self.height = height
         self.name = name
 
+    @property
+    def is_solid(self):
+        return self._solid
+
+    @is_solid.setter
+    def is_solid(self, solid):
+        if solid != self._solid:
+            self._solid = solid
+            if self.registry is not None:
+                self.registry.solid_changed(self)
+
+    def set_frame(self, frame):
+        self.image, self.mask = frame
+
+    def wake(self):
+        if self.scheduler is not None:
+            self.scheduler.add(self)
+
+    def is_active(self):
+        # Whether loop() still has work to do; idle objects are not updated
+        return False
+
     def draw(self, win, offset_x):
         win.blit(self.image, (self.rect.x - offset_x, self.rect.y))
 
@@ -187,38 +969,136 @@ class Object(pygame.sprite.Sprite):
 class Block(Object):
     def __init__(self, x, y, size):
         super().__init__(x, y, size, size)
-        block = get_block(size)
-        self.image.blit(block, (0, 0))
-        self.mask = pygame.mask.from_surface(self.image)
+        self.set_frame(get_block_frame(size))
         self.is_solid = True
 
 
-class TileBlock(Object):
-    def __init__(self, x, y, tile_surface, tile_w, tile_h):
-        super().__init__(x, y, tile_w, tile_h)
-        # Use tile image coming from TMX tileset directly
-        self.image = pygame.Surface((tile_w, tile_h), pygame.SRCALPHA)
-        self.image.blit(tile_surface, (0, 0))
-        self.mask = pygame.mask.from_surface(self.image)
-        self.is_solid = True
+_FILLED_MASKS = {}
+
+
+def filled_mask(width, height):
+    # Shared completely set mask, e.g. for every merged run of the same size
+    mask = _FILLED_MASKS.get((width, height))
+    if mask is None:
+        mask = pygame.mask.Mask((width, height), fill=True)
+        _FILLED_MASKS[(width, height)] = mask
+    return mask
+
+
+class TileCollider:
+    """Base for the colliders of solid map tiles.
+
+    Not a Sprite: a level can hold hundreds of thousands of these, they are in
+    no sprite group, and collide_mask/collide_rect only need rect and mask.
+    The class attributes stand in for the Object ones Level reads; the tiles
+    are drawn from TileChunks.
+    """
+    __slots__ = ("rect", "mask", "registry", "scheduler")
+    baked = True
+    animation_only = False
+    hazard = False
+    touch_trigger = False
+    is_solid = True
+    name = None
+
+    def is_active(self):
+        return False
+
+    def draw(self, win, offset_x):
+        pass
+
+
+class SolidRect(TileCollider):
+    """Collider for a rectangle of fully opaque solid tiles merged at load time.
+
+    Its mask is completely filled, so mask collision tests against it reduce to
+    the player's mask against a rectangle. A rectangle spanning several tile
+    rows (row_height each) stands for one collider per row; rows() hands those
+    out for the vertical pass, see handle_vertical_collision.
+    """
+    __slots__ = ("row_height", "_rows")
+
+    def __init__(self, x, y, width, height, row_height=None):
+        self.rect = pygame.Rect(x, y, width, height)
+        self.mask = filled_mask(width, height)
+        self.registry = None
+        self.scheduler = None
+        self.row_height = row_height or height
+        self._rows = None
+
+    def rows(self):
+        """One SolidRect per tile row, top to bottom; just self for a single row."""
+        if self._rows is None:
+            rect = self.rect
+            if rect.height <= self.row_height:
+                self._rows = (self,)
+            else:
+                self._rows = tuple(SolidRect(rect.x, y, rect.width, self.row_height)
+                                   for y in range(rect.y, rect.bottom, self.row_height))
+        return self._rows
+
+
+def merge_cells(cells):
+    """Cover a set of (x, y) grid cells with rectangles.
+
+    Each row is cut into runs that grow right as far as possible from their
+    leftmost cell, and a run is stacked onto the one right above it when both
+    span the same columns. Every row of a rectangle is then exactly one such
+    run, which handle_vertical_collision relies on to snap the player to the
+    row it touched. Returns (x, y, w, h) tuples ordered by their top-left cell.
+    """
+    rects = []
+    # (x, w) -> rectangle whose bottom row was the last run with those columns
+    open_rects = {}
+    run = None
+    for x, y in sorted(cells, key=lambda cell: (cell[1], cell[0])):
+        if run is not None and run[1] == y and run[0] + run[2] == x:
+            run[2] += 1
+            continue
+        if run is not None:
+            _stack_run(run, open_rects, rects)
+        run = [x, y, 1, 1]
+    if run is not None:
+        _stack_run(run, open_rects, rects)
+    rects.sort(key=lambda rect: (rect[1], rect[0]))
+    return [tuple(rect) for rect in rects]
+
+
+def _stack_run(run, open_rects, rects):
+    above = open_rects.get((run[0], run[2]))
+    if above is not None and above[1] + above[3] == run[1]:
+        above[3] += 1
+    else:
+        open_rects[(run[0], run[2])] = run
+        rects.append(run)
+
+
+class TileBlock(TileCollider):
+    """Collider for one solid tile that isn't fully opaque (see SolidRect).
+
+    Tiles of the same gid share one frame (see LevelBuilder.tile_frame), of
+    which a TileBlock only keeps the mask.
+    """
+    __slots__ = ()
+
+    def __init__(self, x, y, frame):
+        self.rect = pygame.Rect((x, y), frame.image.get_size())
+        self.mask = frame.mask
+        self.registry = None
+        self.scheduler = None
 
 
 class DisappearingBlock(Object):
     ANIMATION_DURATION_MS = 50
     RESPAWN_MS_DEFAULT = 0  # 0 = do not respawn
 
-    def __init__(self, x, y, width, height, tile_surface=None, respawn_ms=None):
+    def __init__(self, x, y, width, height, tile_frame=None, respawn_ms=None):
         super().__init__(x, y, width, height, name="trap")
-        # Base image
-        self.base_image = pygame.Surface((width, height), pygame.SRCALPHA)
-        if tile_surface is not None:
-            self.base_image.blit(tile_surface, (0, 0))
-        else:
-            block = get_block(width)
-            self.base_image.blit(block, (0, 0))
+        # Base image: the map tile's shared frame, or the default block
+        self.base_frame = tile_frame if tile_frame is not None else get_block_frame(width, height)
+        self.base_image = self.base_frame.image
 
-        self.image = self.base_image.copy()
-        self.mask = pygame.mask.from_surface(self.image)
+        self.set_frame(self.base_frame)
 
         self.is_solid = True
         self.triggered = False
@@ -229,48 +1109,45 @@ class DisappearingBlock(Object):
         if self.triggered:
             return
         self.triggered = True
-        self.trigger_time_ms = pygame.time.get_ticks()
+        self.trigger_time_ms = get_ticks()
         # Disappear instantly: non-solid and invisible right away
         self.is_solid = False
-        self.image = pygame.Surface((self.width, self.height), pygame.SRCALPHA)
-        self.mask = pygame.mask.from_surface(self.image)
+        self.set_frame(empty_frame(self.width, self.height))
+        self.wake()
+
+    def is_active(self):
+        # Only a pending respawn needs updates
+        return self.triggered and bool(self.respawn_ms)
 
     def loop(self):
         if not self.triggered:
             return
-        now = pygame.time.get_ticks()
+        now = get_ticks()
         elapsed = now - (self.trigger_time_ms or now)
         # Handle optional respawn
         if self.respawn_ms and elapsed >= self.respawn_ms:
             self.triggered = False
-            self.image = self.base_image.copy()
-            self.image.set_alpha(255)
+            self.set_frame(self.base_frame)
             self.is_solid = True
-            self.mask = pygame.mask.from_surface(self.image)
 
     def reset(self):
         # Back to initial: visible and solid
         self.triggered = False
         self.trigger_time_ms = None
-        self.image = self.base_image.copy()
-        self.image.set_alpha(255)
+        self.set_frame(self.base_frame)
         self.is_solid = True
-        self.mask = pygame.mask.from_surface(self.image)
 
 
 class AppearingBlock(Object):
-    def __init__(self, x, y, width, height, tile_surface=None):
+    touch_trigger = True
+
+    def __init__(self, x, y, width, height, tile_frame=None):
         super().__init__(x, y, width, height, name="appear")
-        self.base_image = pygame.Surface((width, height), pygame.SRCALPHA)
-        if tile_surface is not None:
-            self.base_image.blit(tile_surface, (0, 0))
-        else:
-            block = get_block(width)
-            self.base_image.blit(block, (0, 0))
+        self.base_frame = tile_frame if tile_frame is not None else get_block_frame(width, height)
+        self.base_image = self.base_frame.image
 
         # Start invisible and non-solid
-        self.image = pygame.Surface((width, height), pygame.SRCALPHA)
-        self.mask = pygame.mask.from_surface(self.image)
+        self.set_frame(empty_frame(width, height))
         self.is_solid = False
         self.triggered = False
 
@@ -279,87 +1156,106 @@ class AppearingBlock(Object):
             return
         self.triggered = True
         # Instantly become visible and solid
-        self.image = self.base_image.copy()
-        self.image.set_alpha(255)
+        self.set_frame(self.base_frame)
         self.is_solid = True
-        self.mask = pygame.mask.from_surface(self.image)
 
     def reset(self):
         # Back to initial: invisible and non-solid
         self.triggered = False
-        self.image = pygame.Surface((self.width, self.height), pygame.SRCALPHA)
-        self.mask = pygame.mask.from_surface(self.image)
+        self.set_frame(empty_frame(self.width, self.height))
         self.is_solid = False
 
 class Fire(Object):
     ANIMATION_DELAY = 3
+    animation_only = True
+    hazard = True
 
     def __init__(self, x, y, width, height):
         super().__init__(x, y, width, height, "fire")
         self.fire = load_sprite_sheets("Traps", "Fire", width, height)
-        self.image = self.fire["off"][0]
-        self.mask = pygame.mask.from_surface(self.image)
+        self.set_frame(self.fire["off"][0])
         self.animation_count = 0
         self.animation_name = "off"
 
     def on(self):
         self.animation_name = "on"
 
+    def is_active(self):
+        return True
+
     def off(self):
         self.animation_name = "off"
 
+    def reset(self):
+        # Back to the first frame of the burning animation, as after loading
+        self.animation_count = 0
+        self.animation_name = "on"
+        self.set_frame(self.fire["on"][0])
+
     def loop(self):
         sprites = self.fire[self.animation_name]
         sprite_index = (self.animation_count //
                         self.ANIMATION_DELAY) % len(sprites)
-        self.image = sprites[sprite_index]
+        self.set_frame(sprites[sprite_index])
         self.animation_count += 1
 
         self.rect = self.image.get_rect(topleft=(self.rect.x, self.rect.y))
-        self.mask = pygame.mask.from_surface(self.image)
 
         if self.animation_count // self.ANIMATION_DELAY > len(sprites):
             self.animation_count = 0
 
 
 class Spike(Object):
-    def __init__(self, x, y, width, height, tile_surface=None, orientation="up"):
+    hazard = True
+
+    def __init__(self, x, y, width, height, tile_frame=None, orientation="up"):
+        # tile_frame, if given, is already flipped for the orientation
         super().__init__(x, y, width, height, name="spike")
-        if tile_surface is not None:
-            self.image = pygame.Surface((width, height), pygame.SRCALPHA)
-            self.image.blit(tile_surface, (0, 0))
+        flip_v = str(orientation).lower() in ("down", "top")
+        if tile_frame is not None:
+            self.set_frame(tile_frame)
         else:
             # Fallback to Spikes sprite from assets
             path = join("assets", "Traps", "Spikes", "Idle.png")
-            img = pygame.image.load(path).convert_alpha()
-            self.image = pygame.transform.smoothscale(img, (width, height))
-        if str(orientation).lower() in ("down", "top"):
-            self.image = pygame.transform.flip(self.image, False, True)
-        self.mask = pygame.mask.from_surface(self.image)
+            self.set_frame(ASSETS.frame(path, scale=(width, height), flip=(False, flip_v)))
         # Spikes are non-solid hazard by default (you can toggle if needed)
         self.is_solid = False
 
 
+# Reveal steps of spikes drawn with the default sprite, by (width, height, flip)
+_REVEAL_FRAMES = {}
+
+
 class HiddenSpike(Object):
+    hazard = True
     RISE_DURATION_MS = 250
+    # Number of precomputed reveal steps between hidden and fully up
+    REVEAL_FRAMES = 16
 
-    def __init__(self, x, y, width, height, tile_surface=None, orientation="up"):
+    def __init__(self, x, y, width, height, tile_frame=None, orientation="up", reveal_frames=None):
+        # tile_frame, if given, is already flipped for the orientation;
+        # reveal_frames shares reveal steps between spikes using that frame
         super().__init__(x, y, width, height, name="spike")
         # Base spike appearance
-        if tile_surface is not None:
-            self.base_image = pygame.Surface((width, height), pygame.SRCALPHA)
-            self.base_image.blit(tile_surface, (0, 0))
+        self.orientation = str(orientation).lower()
+        flip_v = self.orientation in ("down", "top")
+        if tile_frame is not None:
+            self.base_image = tile_frame.image
+            cache = reveal_frames if reveal_frames is not None else {}
+            key = (tile_frame, width, height, flip_v)
         else:
             path = join("assets", "Traps", "Spikes", "Idle.png")
-            img = pygame.image.load(path).convert_alpha()
-            self.base_image = pygame.transform.smoothscale(img, (width, height))
-        self.orientation = str(orientation).lower()
-        if self.orientation in ("down", "top"):
-            self.base_image = pygame.transform.flip(self.base_image, False, True)
+            self.base_image = ASSETS.image(path, scale=(width, height), flip=(False, flip_v))
+            cache = _REVEAL_FRAMES
+            key = (width, height, flip_v)
+
+        # Spikes with the same look share their reveal steps
+        self.reveal_frames = cache.get(key)
+        if self.reveal_frames is None:
+            self.reveal_frames = cache[key] = self._build_reveal_frames()
 
         # Start hidden
-        self.image = pygame.Surface((width, height), pygame.SRCALPHA)
-        self.mask = pygame.mask.from_surface(self.image)
+        self.set_frame(empty_frame(width, height))
         self.is_solid = False
         self.active_hazard = False
         self.triggered = False
@@ -369,25 +1265,35 @@ class HiddenSpike(Object):
         if self.triggered:
             return
         self.triggered = True
-        self.start_ms = pygame.time.get_ticks()
+        self.start_ms = get_ticks()
+        self.wake()
+
+    def is_active(self):
+        return self.triggered and not self.active_hazard
+
+    def _build_reveal_frames(self):
+        frames = []
+        for step in range(self.REVEAL_FRAMES + 1):
+            image = pygame.Surface((self.width, self.height), pygame.SRCALPHA)
+            reveal_h = max(1, int(self.height * step / self.REVEAL_FRAMES))
+            if self.orientation in ("down", "top"):
+                # reveal from top to bottom
+                src_rect = pygame.Rect(0, 0, self.width, reveal_h)
+                image.blit(self.base_image, (0, 0), src_rect)
+            else:
+                # reveal from bottom to top
+                src_rect = pygame.Rect(0, self.height - reveal_h, self.width, reveal_h)
+                image.blit(self.base_image, (0, self.height - reveal_h), src_rect)
+            frames.append(make_frame(image))
+        return frames
 
     def loop(self):
         if not self.triggered:
             return
-        now = pygame.time.get_ticks()
+        now = get_ticks()
         t = max(0, min(1, (now - self.start_ms) / self.RISE_DURATION_MS))
-        # Rebuild image as reveal from bottom or top depending on orientation
-        self.image = pygame.Surface((self.width, self.height), pygame.SRCALPHA)
-        reveal_h = max(1, int(self.height * t))
-        if self.orientation in ("down", "top"):
-            # reveal from top to bottom
-            src_rect = pygame.Rect(0, 0, self.width, reveal_h)
-            self.image.blit(self.base_image, (0, 0), src_rect)
-        else:
-            # reveal from bottom to top
-            src_rect = pygame.Rect(0, self.height - reveal_h, self.width, reveal_h)
-            self.image.blit(self.base_image, (0, self.height - reveal_h), src_rect)
-        self.mask = pygame.mask.from_surface(self.image)
+        # Show the precomputed reveal step from bottom or top depending on orientation
+        self.set_frame(self.reveal_frames[int(t * self.REVEAL_FRAMES)])
         # Become solid and hazardous once fully up
         if t >= 1:
             self.is_solid = False  # spikes remain non-solid but hazardous
@@ -398,13 +1304,14 @@ class HiddenSpike(Object):
         self.triggered = False
         self.active_hazard = False
         self.start_ms = 0
-        self.image = pygame.Surface((self.width, self.height), pygame.SRCALPHA)
-        self.mask = pygame.mask.from_surface(self.image)
+        self.set_frame(empty_frame(self.width, self.height))
         self.is_solid = False
         
 
 class Checkpoint(Object):
     ANIMATION_DELAY = 4
+    animation_only = True
+    touch_trigger = True
 
     def __init__(self, x, y, width=64, height=64):
         super().__init__(x, y, width, height, name="checkpoint")
@@ -412,30 +1319,23 @@ class Checkpoint(Object):
         # Load images
         base_dir = join("assets", "Items", "Checkpoints", "Checkpoint")
         # No flag static
-        no_flag_img = pygame.image.load(join(base_dir, "Checkpoint (No Flag).png")).convert_alpha()
-        self.no_flag = pygame.transform.smoothscale(no_flag_img, (width, height))
+        self.no_flag = ASSETS.frame(join(base_dir, "Checkpoint (No Flag).png"), scale=(width, height))
         # Flag out sheet (animation)
-        flag_out_sheet = pygame.image.load(join(base_dir, "Checkpoint (Flag Out) (64x64).png")).convert_alpha()
-        self.flag_out_frames = self._slice_and_scale(flag_out_sheet, 64, 64, width, height)
+        self.flag_out_frames = self._slice_and_scale(
+            join(base_dir, "Checkpoint (Flag Out) (64x64).png"), 64, 64, width, height)
         # Flag idle sheet (loop animation)
-        flag_idle_sheet = pygame.image.load(join(base_dir, "Checkpoint (Flag Idle)(64x64).png")).convert_alpha()
-        self.flag_idle_frames = self._slice_and_scale(flag_idle_sheet, 64, 64, width, height)
+        self.flag_idle_frames = self._slice_and_scale(
+            join(base_dir, "Checkpoint (Flag Idle)(64x64).png"), 64, 64, width, height)
 
         self.state = "no_flag"  # no_flag -> flag_out -> idle
         self.animation_count = 0
-        self.image = self.no_flag
-        self.mask = pygame.mask.from_surface(self.image)
+        self.set_frame(self.no_flag)
         self.activated = False
 
-    def _slice_and_scale(self, sheet, frame_w, frame_h, out_w, out_h):
-        frames = []
-        num = max(1, sheet.get_width() // frame_w)
-        for i in range(num):
-            surface = pygame.Surface((frame_w, frame_h), pygame.SRCALPHA)
-            rect = pygame.Rect(i * frame_w, 0, frame_w, frame_h)
-            surface.blit(sheet, (0, 0), rect)
-            frames.append(pygame.transform.smoothscale(surface, (out_w, out_h)))
-        return frames
+    def _slice_and_scale(self, sheet_path, frame_w, frame_h, out_w, out_h):
+        num = max(1, ASSETS.image(sheet_path).get_width() // frame_w)
+        return [ASSETS.frame(sheet_path, (i * frame_w, 0, frame_w, frame_h), (out_w, out_h))
+                for i in range(num)]
 
     def trigger(self):
         if self.activated:
@@ -443,11 +1343,16 @@ class Checkpoint(Object):
         self.activated = True
         self.state = "flag_out"
         self.animation_count = 0
+        self.wake()
+
+    def is_active(self):
+        # The flag keeps waving once raised
+        return self.state != "no_flag"
 
     def loop(self):
         if self.state == "no_flag":
             # idle without flag
-            self.image = self.no_flag
+            self.set_frame(self.no_flag)
         elif self.state == "flag_out":
             sprites = self.flag_out_frames
             sprite_index = (self.animation_count // self.ANIMATION_DELAY)
@@ -455,65 +1360,61 @@ class Checkpoint(Object):
                 # transition to idle flag loop
                 self.state = "idle"
                 self.animation_count = 0
-                self.image = self.flag_idle_frames[0]
+                self.set_frame(self.flag_idle_frames[0])
             else:
-                self.image = sprites[sprite_index]
+                self.set_frame(sprites[sprite_index])
                 self.animation_count += 1
         elif self.state == "idle":
             sprites = self.flag_idle_frames
             sprite_index = (self.animation_count // self.ANIMATION_DELAY) % len(sprites)
-            self.image = sprites[sprite_index]
+            self.set_frame(sprites[sprite_index])
             self.animation_count += 1
 
-        # Update collision mask each frame in case of change
-        self.mask = pygame.mask.from_surface(self.image)
-
     def reset(self):
         # Back to initial: no flag and not activated
         self.state = "no_flag"
         self.animation_count = 0
-        self.image = self.no_flag
-        self.mask = pygame.mask.from_surface(self.image)
+        self.set_frame(self.no_flag)
         self.activated = False
 
 
 class End(Object):
+    touch_trigger = True
+
     def __init__(self, x, y, width=64, height=64):
         super().__init__(x, y, width, height, name="end")
         self.is_solid = False
         base_dir = join("assets", "Items", "Checkpoints", "End")
-        idle_img = pygame.image.load(join(base_dir, "End (Idle).png")).convert_alpha()
-        pressed_img = pygame.image.load(join(base_dir, "End (Pressed) (64x64).png")).convert_alpha()
-        self.idle = pygame.transform.smoothscale(idle_img, (width, height))
-        self.pressed = pygame.transform.smoothscale(pressed_img, (width, height))
+        self.idle = ASSETS.frame(join(base_dir, "End (Idle).png"), scale=(width, height))
+        self.pressed = ASSETS.frame(join(base_dir, "End (Pressed) (64x64).png"), scale=(width, height))
         self.activated = False
         self.activated_at_ms = 0
-        self.image = self.idle
-        self.mask = pygame.mask.from_surface(self.image)
+        self.set_frame(self.idle)
 
     def trigger(self):
         if self.activated:
             return
         self.activated = True
-        self.activated_at_ms = pygame.time.get_ticks()
-        self.image = self.pressed
-        self.mask = pygame.mask.from_surface(self.image)
+        self.activated_at_ms = get_ticks()
+        self.set_frame(self.pressed)
+        self.wake()
+
+    def is_active(self):
+        return self.activated and get_ticks() - self.activated_at_ms < 1500
 
     def reset(self):
         self.activated = False
         self.activated_at_ms = 0
-        self.image = self.idle
-        self.mask = pygame.mask.from_surface(self.image)
+        self.set_frame(self.idle)
 
     def loop(self):
         # Simple visual feedback during the first 1.5s after activation: blink idle/pressed
         if not self.activated:
             return
-        elapsed = pygame.time.get_ticks() - (self.activated_at_ms or 0)
+        elapsed = get_ticks() - (self.activated_at_ms or 0)
         if elapsed < 1500:
             phase = (elapsed // 200) % 2
-            self.image = self.pressed if phase == 0 else self.idle
-            self.mask = pygame.mask.from_surface(self.image)
+            self.set_frame(self.pressed if phase == 0 else self.idle)
 
 class Box(Object):
     BROKEN_HIDE_DELAY_MS = 250
@@ -523,11 +1424,15 @@ class Box(Object):
         super().__init__(x, y, width, height, name="box")
         # Load the Box2 idle image and scale to requested size
         box_path = join("assets", "Items", "Boxes", str(variant), "Idle.png")
-        base_img = pygame.image.load(box_path).convert_alpha()
-        scaled_img = pygame.transform.smoothscale(base_img, (width, height))
-        self.image = pygame.Surface((width, height), pygame.SRCALPHA)
-        self.image.blit(scaled_img, (0, 0))
-        self.mask = pygame.mask.from_surface(self.image)
+        self.idle_frame = ASSETS.frame(box_path, scale=(width, height))
+        # Break sprite shown briefly once the box is landed on
+        break_path = join("assets", "Items", "Boxes", str(variant), "Break.png")
+        try:
+            self.break_frame = ASSETS.frame(break_path, scale=(width, height))
+        except Exception:
+            # Fallback to instantly invisible if asset missing
+            self.break_frame = empty_frame(width, height)
+        self.set_frame(self.idle_frame)
         self.is_solid = True
         self.variant = variant
         self.broken = False
@@ -539,50 +1444,246 @@ class Box(Object):
         self.broken = True
         self.is_solid = False
         # Show break sprite briefly, then hide
-        break_path = join("assets", "Items", "Boxes", str(self.variant), "Break.png")
-        try:
-            break_img = pygame.image.load(break_path).convert_alpha()
-            break_scaled = pygame.transform.smoothscale(break_img, (self.width, self.height))
-            self.image = pygame.Surface((self.width, self.height), pygame.SRCALPHA)
-            self.image.blit(break_scaled, (0, 0))
-        except Exception:
-            # Fallback to instantly invisible if asset missing
-            self.image = pygame.Surface((self.width, self.height), pygame.SRCALPHA)
-        self.mask = pygame.mask.from_surface(self.image)
-        self.broken_at_ms = pygame.time.get_ticks()
+        self.set_frame(self.break_frame)
+        self.broken_at_ms = get_ticks()
+        self.wake()
+
+    def is_active(self):
+        # Stays active until loop() has hidden the break sprite
+        return self.broken and get_ticks() - self.broken_at_ms < self.BROKEN_HIDE_DELAY_MS
 
     def loop(self):
         if self.broken:
-            if pygame.time.get_ticks() - self.broken_at_ms >= self.BROKEN_HIDE_DELAY_MS:
+            if get_ticks() - self.broken_at_ms >= self.BROKEN_HIDE_DELAY_MS:
                 # Hide after delay
-                self.image = pygame.Surface((self.width, self.height), pygame.SRCALPHA)
-                self.mask = pygame.mask.from_surface(self.image)
+                self.set_frame(empty_frame(self.width, self.height))
 
     def reset(self):
         # Restore unbroken box
-        box_path = join("assets", "Items", "Boxes", str(self.variant), "Idle.png")
-        base_img = pygame.image.load(box_path).convert_alpha()
-        scaled_img = pygame.transform.smoothscale(base_img, (self.width, self.height))
-        self.image = pygame.Surface((self.width, self.height), pygame.SRCALPHA)
-        self.image.blit(scaled_img, (0, 0))
-        self.mask = pygame.mask.from_surface(self.image)
+        self.set_frame(self.idle_frame)
         self.is_solid = True
         self.broken = False
         self.broken_at_ms = 0
+
+
 def get_background(name):
+    # The tile is repeated across the window once, into a single opaque surface
     image = pygame.image.load(join("assets", "Background", name))
     _, _, width, height = image.get_rect()
-    tiles = []
+    background = pygame.Surface((WIDTH, HEIGHT)).convert()
 
     for i in range(WIDTH // width + 1):
         for j in range(HEIGHT // height + 1):
             pos = (i * width, j * height)
-            tiles.append(pos)
+            background.blit(image, pos)
+
+    return background
+
+
+# Compiled levels: a header followed by the pickled output of decode_tmx()
+LEVEL_CACHE_DIR = join(".cache", "levels")
+LEVEL_CACHE_MAGIC = b"UPLV"
+LEVEL_CACHE_VERSION = 3
+# magic, format version, TMX mtime (ns), TMX SHA-1
+_LEVEL_HEADER = struct.Struct("<4sHq20s")
+
 
-    return tiles, image
+def _flatten_chunks(root, unpack_gids):
+    """Rewrite the chunked layers of an infinite map's XML as fixed-size layers.
 
+    pytmx can't read chunked layer data, so every layer's chunks are pasted
+    into one CSV grid spanning all chunks of the map, which must then be
+    shifted right and down by the returned (columns, rows) to start at 0.
+    """
+    layers = [(layer, layer.find("data")) for layer in root.iter("layer")]
+    layers = [(layer, data) for layer, data in layers if data is not None and data.find("chunk") is not None]
+    chunks = [[int(chunk.get(key)) for key in ("x", "y", "width", "height")]
+              for _, data in layers for chunk in data.iter("chunk")]
+    if not chunks:
+        return 0, 0
+    left = min(0, min(x for x, _, _, _ in chunks))
+    top = min(0, min(y for _, y, _, _ in chunks))
+    width = max(x + w for x, _, w, _ in chunks) - left
+    height = max(y + h for _, y, _, h in chunks) - top
+    for layer, data in layers:
+        gids = [0] * (width * height)
+        for chunk in data.findall("chunk"):
+            x, y, w, h = (int(chunk.get(key)) for key in ("x", "y", "width", "height"))
+            chunk_gids = unpack_gids(chunk.text.strip(), data.get("encoding"), data.get("compression"))
+            for row in range(h):
+                start = (y - top + row) * width + x - left
+                gids[start:start + w] = chunk_gids[row * w:(row + 1) * w]
+            data.remove(chunk)
+        data.attrib.pop("compression", None)
+        data.set("encoding", "csv")
+        data.text = ",".join(map(str, gids))
+        layer.set("width", str(width))
+        layer.set("height", str(height))
+    root.set("width", str(width))
+    root.set("height", str(height))
+    return -left, -top
+
+
+def decode_tmx(tmx_path):
+    """Parse a TMX map into plain, picklable level data.
+
+    Tile layers become flat gid arrays, objects become attribute records and
+    only the tile images actually referenced are kept, as raw RGBA bytes. No
+    display is needed, so this can run off the main thread.
+    """
+    sources = {}
+
+    def raw_tile_loader(filename, colorkey, **kwargs):
+        # Like pytmx's pygame loader, minus convert(): plain surfaces only
+        image = pygame.image.load(filename)
+        sources[filename] = os.stat(filename).st_mtime_ns
+
+        def load(rect=None, flags=None):
+            tile = image.subsurface(rect) if rect else image
+            if flags:
+                tile = pytmx.util_pygame.handle_transformation(tile, flags)
+            if colorkey:
+                keyed = tile.copy()
+                keyed.set_colorkey(pygame.Color(f"#{colorkey}"))
+                tile = pygame.Surface(keyed.get_size(), pygame.SRCALPHA, 32)
+                tile.blit(keyed, (0, 0))
+            return tile
+
+        return load
+
+    pytmx = import_pytmx()
+    root = ElementTree.parse(tmx_path).getroot()
+    infinite = root.get("infinite", "0") == "1"
+    shift_x = shift_y = 0
+    if infinite:
+        shift_x, shift_y = _flatten_chunks(root, pytmx.pytmx.unpack_gids)
+    tmx = pytmx.TiledMap(image_loader=raw_tile_loader)
+    tmx.filename = tmx_path
+    tmx.parse_xml(root)
+    used_gids = set()
+
+    layers = []
+    for layer in tmx.visible_layers:
+        if not isinstance(layer, pytmx.TiledTileLayer):
+            continue
+        width, height = int(layer.width), int(layer.height)
+        gids = array("I", bytes(4 * width * height))
+        for x, y, gid in layer.iter_data():
+            if gid:
+                gids[y * width + x] = gid
+                used_gids.add(gid)
+        layer_name = (getattr(layer, "name", "") or "").lower()
+        is_solid = layer_name in ("solid", "ground", "platform")
+        if getattr(layer, "properties", None):
+            is_solid = is_solid or bool(layer.properties.get("solid"))
+        layers.append({"name": layer_name, "solid": is_solid, "width": width, "height": height, "gids": gids})
+
+    objects = []
+    for obj in getattr(tmx, "objects", []):
+        gid = getattr(obj, "gid", None)
+        if gid:
+            used_gids.add(gid)
+        objects.append(SimpleNamespace(
+            type=getattr(obj, "type", None), name=getattr(obj, "name", None),
+            x=obj.x + shift_x * tmx.tilewidth, y=obj.y + shift_y * tmx.tileheight, width=getattr(obj, "width", None), height=getattr(obj, "height", None),
+            gid=gid, properties=dict(getattr(obj, "properties", None) or {})))
+
+    tiles = {}
+    for gid in sorted(used_gids):
+        try:
+            image = tmx.get_tile_image_by_gid(gid)
+        except ValueError:
+            # An object gid with no image behind it; such objects fall back to their default sprite
+            image = None
+        if image is not None:
+            tiles[gid] = (image.get_width(), image.get_height(), pygame.image.tobytes(image, "RGBA"))
+
+    return {
+        "infinite": infinite,
+        "width": getattr(tmx, "width", None),
+        "height": getattr(tmx, "height", None),
+        "tile_w": getattr(tmx, "tilewidth", None),
+        "tile_h": getattr(tmx, "tileheight", None),
+        "layers": layers,
+        "objects": objects,
+        "tiles": tiles,
+        "sources": sources,
+    }
+
+
+def _level_cache_path(tmx_path):
+    name = os.path.splitext(os.path.basename(tmx_path))[0]
+    key = hashlib.sha1(os.path.abspath(tmx_path).encode("utf-8")).hexdigest()[:10]
+    return join(LEVEL_CACHE_DIR, f"{name}-{key}.lvl")
+
+
+def _read_compiled_level(cache_path, tmx_path, mtime_ns):
+    # One bulk read; the TMX is only hashed when its mtime changed
+    try:
+        with open(cache_path, "rb") as f:
+            blob = f.read()
+        magic, version, cached_mtime_ns, cached_digest = _LEVEL_HEADER.unpack_from(blob)
+    except (OSError, struct.error):
+        return None
+    if magic != LEVEL_CACHE_MAGIC or version != LEVEL_CACHE_VERSION:
+        return None
+    if cached_mtime_ns != mtime_ns:
+        with open(tmx_path, "rb") as f:
+            if hashlib.sha1(f.read()).digest() != cached_digest:
+                return None
+    try:
+        data = pickle.loads(memoryview(blob)[_LEVEL_HEADER.size:])
+    except Exception:
+        return None
+    for source, source_mtime_ns in data["sources"].items():
+        try:
+            if os.stat(source).st_mtime_ns != source_mtime_ns:
+                return None
+        except OSError:
+            return None
+    return data
+
+
+def _write_compiled_level(cache_path, tmx_path, mtime_ns, data):
+    with open(tmx_path, "rb") as f:
+        digest = hashlib.sha1(f.read()).digest()
+    os.makedirs(os.path.dirname(cache_path), exist_ok=True)
+    tmp_path = f"{cache_path}.{os.getpid()}.tmp"
+    with open(tmp_path, "wb") as f:
+        f.write(_LEVEL_HEADER.pack(LEVEL_CACHE_MAGIC, LEVEL_CACHE_VERSION, mtime_ns, digest))
+        f.write(pickle.dumps(data, protocol=pickle.HIGHEST_PROTOCOL))
+    os.replace(tmp_path, cache_path)
+
+
+def load_level_data(tmx_path):
+    """Decoded level data for tmx_path, from the compiled cache when it is fresh.
+
+    The cache is rebuilt whenever the TMX content or a tileset image changes.
+    Returns None if the map doesn't exist or can't be parsed.
+    """
+    if not os.path.exists(tmx_path):
+        return None
+    mtime_ns = os.stat(tmx_path).st_mtime_ns
+    cache_path = _level_cache_path(tmx_path)
+    data = _read_compiled_level(cache_path, tmx_path, mtime_ns)
+    if data is not None:
+        return data
+
+    if import_pytmx() is None:
+        return None
+    try:
+        data = decode_tmx(tmx_path)
+    except Exception as e:
+        print("TMX load failed:", e)
+        return None
+    try:
+        _write_compiled_level(cache_path, tmx_path, mtime_ns, data)
+    except OSError as e:
+        print("Could not write level cache:", e)
+    return data
 
-def load_tmx_level(tmx_path, block_size):
+
+def load_tmx_level(tmx_path, block_size, stream=None):
     """Load a Tiled TMX map and build game objects.
 
     Expectations for the map:
@@ -590,86 +1691,154 @@ def load_tmx_level(tmx_path, block_size):
     - Optionally place an object of type "player" (or name "player") for spawn.
     - Optionally place objects of type "fire" for hazards.
     Tile size in Tiled should match block_size for best visuals.
-    """
-    if not _PYTMX_AVAILABLE:
-        return None, None
 
-    if not os.path.exists(tmx_path):
-        return None, None
+    Parsed maps are compiled into a binary cache (see load_level_data), so
+    reloading an unchanged map skips TMX parsing entirely.
 
-    try:
-        tmx = load_tmx(tmx_path)
-    except Exception as e:
-        print("TMX load failed:", e)
-        return None, None
+    Large and infinite maps are streamed in around the camera; stream forces
+    that on or off (see build_level).
 
-    # Diagnostics to help verify map type and loading behavior
-    try:
-        is_infinite = bool(getattr(tmx, "infinite", False))
-        map_w = getattr(tmx, "width", None)
-        map_h = getattr(tmx, "height", None)
-        tile_w_dbg = getattr(tmx, "tilewidth", None)
-        tile_h_dbg = getattr(tmx, "tileheight", None)
-        print(f"Loaded TMX: {tmx_path} | infinite={is_infinite} | size={map_w}x{map_h} | tile={tile_w_dbg}x{tile_h_dbg}")
-    except Exception:
-        pass
+    Returns a Level holding the objects, the spawn point and a spatial index
+    of the objects, or None if the map could not be loaded.
+    """
+    data = load_level_data(tmx_path)
+    if data is None:
+        return None
+    return build_level(data, tmx_path, block_size, stream)
 
-    objects = []
-    player_spawn = None
 
-    # Use TMX tile size if available
-    tile_w = getattr(tmx, "tilewidth", block_size)
-    tile_h = getattr(tmx, "tileheight", block_size)
-    effective_block = int(tile_w)
+class LevelBuilder:
+    """Builds tiles and game objects from decoded level data (see decode_tmx).
 
-    # Collect tile layers and detect which are solid
-    tile_layers = []
-    solid_layers = []
-    for layer in tmx.visible_layers:
-        tiles_iter = getattr(layer, "tiles", None)
-        if callable(tiles_iter):
-            tile_layers.append(layer)
-            is_solid = False
-            layer_name = (getattr(layer, "name", "") or "").lower()
-            if layer_name in ("solid", "ground", "platform"):
-                is_solid = True
-            if getattr(layer, "properties", None):
-                is_solid = is_solid or bool(layer.properties.get("solid"))
-            if is_solid:
-                solid_layers.append(layer)
-
-    # If no explicit solid layer was found, treat all tile layers as solid
-    layers_to_use = solid_layers if len(solid_layers) > 0 else tile_layers
-
-    for layer in layers_to_use:
-        for x, y, gid_or_surface in layer.tiles():
-            if not gid_or_surface:
-                continue
-            world_x = int(x * tile_w)
-            world_y = int(y * tile_h)
-            tile_img = None
-            # pytmx with load_pygame may return a Surface instead of gid
-            if isinstance(gid_or_surface, pygame.Surface):
-                tile_img = gid_or_surface
-            else:
-                tile_img = tmx.get_tile_image_by_gid(gid_or_surface)
+    Keeps what every part of the map shares, like the converted tile images
+    and which gids are fully opaque, so a level can be built in one go
+    (build_level) or one range of columns at a time (StreamingLevel).
+    """
 
-            if tile_img is not None:
-                objects.append(TileBlock(world_x, world_y, tile_img, int(tile_w), int(tile_h)))
-            else:
-                # Fallback to generic block if no image is found
-                objects.append(Block(world_x, world_y, effective_block))
+    def __init__(self, data, block_size):
+        # Use TMX tile size if available
+        self.tile_w = int(data["tile_w"] or block_size)
+        self.tile_h = int(data["tile_h"] or block_size)
+        self.tile_images = {gid: pygame.image.frombuffer(raw, (w, h), "RGBA").convert_alpha()
+                            for gid, (w, h, raw) in data["tiles"].items()}
+        self.layers = data["layers"]
+        # If no explicit solid layer was found, treat all tile layers as solid
+        self.any_solid = any(layer["solid"] for layer in self.layers)
+        self.records = data["objects"]
+        # (gid, width, height, flipped) -> shared Frame, see tile_frame()
+        self.frames = {}
+        # Shared HiddenSpike reveal steps per tile frame; freed with the builder
+        self.reveal_frames = {}
+        self.columns = max((layer["width"] for layer in self.layers), default=0)
+        # How far a tile image can reach right of its own cell
+        self.overhang = max([self.tile_w] + [image.get_width() for image in self.tile_images.values()])
+
+        # Tiles whose collision mask is completely full collide exactly like a
+        # rectangle, so each row's runs of them can share one merged collider
+        self.opaque_gids = set()
+        for gid, image in self.tile_images.items():
+            cell = pygame.Surface((self.tile_w, self.tile_h), pygame.SRCALPHA)
+            cell.blit(image, (0, 0))
+            if pygame.mask.from_surface(cell).count() == cell.get_width() * cell.get_height():
+                self.opaque_gids.add(gid)
+
+    def tile_frame(self, gid, width=None, height=None, flip_v=False):
+        """Frame of gid's tile image on a width x height canvas (default: one cell), or None.
+
+        Built once per gid, size and flip and shared by every tile and object
+        using it, so memory grows with the distinct tiles, not their copies.
+        """
+        key = (gid, width or self.tile_w, height or self.tile_h, flip_v)
+        frame = self.frames.get(key)
+        if frame is None:
+            tile_img = self.tile_images.get(gid) if gid else None
+            if tile_img is None:
+                return None
+            image = pygame.Surface(key[1:3], pygame.SRCALPHA)
+            image.blit(tile_img, (0, 0))
+            if flip_v:
+                image = pygame.transform.flip(image, False, True)
+            frame = self.frames[key] = make_frame(image)
+        return frame
+
+    def player_spawn(self):
+        # Bottom-left of the (last) player object
+        spawn = None
+        for obj in self.records:
+            if (getattr(obj, "type", "") or "").lower() == "player" or \
+                    (getattr(obj, "name", "") or "").lower() == "player":
+                spawn = (int(obj.x), int(obj.y - obj.height))
+        return spawn
+
+    def tiles(self, chunks, x0=0, x1=None):
+        """Bake tiles into chunks and return their colliders as sorted (row, column, collider).
+
+        Every static tile layer (solid or decorative) is baked in map order;
+        only solid layers also produce colliders. With x1 given, only tiles
+        whose cell starts in [x0, x1) get colliders and only the chunk columns
+        in that range are drawn, including tiles reaching in from the left;
+        x0 and x1 must then be multiples of the chunk size.
+        """
+        tile_w, tile_h = self.tile_w, self.tile_h
+        if x1 is None:
+            columns = None
+            first = owned = 0
+            stop = self.columns
+        else:
+            columns = range(x0 // chunks.chunk_size, x1 // chunks.chunk_size)
+            first = max(0, (x0 - self.overhang) // tile_w + 1)
+            owned = -(-x0 // tile_w)
+            stop = min(self.columns, -(-x1 // tile_w))
+
+        colliders = []
+        opaque_cells = set()
+        for layer in self.layers:
+            collidable = layer["solid"] or not self.any_solid
+            layer_w = layer["width"]
+            gids = layer["gids"]
+            end = min(stop, layer_w)
+            for y in range(layer["height"]):
+                row = y * layer_w
+                for x in range(first, end):
+                    gid = gids[row + x]
+                    if not gid:
+                        continue
+                    world_x = x * tile_w
+                    world_y = y * tile_h
+                    tile_img = self.tile_images.get(gid)
 
-    # Objects layer for spawn/hazards/traps
-    for obj in getattr(tmx, "objects", []):
+                    if not collidable:
+                        if tile_img is not None:
+                            chunks.add(tile_img, world_x, world_y, columns)
+                        continue
+
+                    if gid in self.opaque_gids:
+                        chunks.add(tile_img.subsurface((0, 0, min(tile_img.get_width(), tile_w),
+                                                        min(tile_img.get_height(), tile_h))),
+                                   world_x, world_y, columns)
+                        if x >= owned:
+                            opaque_cells.add((x, y))
+                        continue
+                    # Fallback to generic block if no image is found
+                    frame = self.tile_frame(gid) or get_block_frame(tile_w)
+                    chunks.add(frame.image, world_x, world_y, columns)
+                    if x >= owned:
+                        colliders.append((y, x, TileBlock(world_x, world_y, frame)))
+
+        for x, y, w, h in merge_cells(opaque_cells):
+            colliders.append((y, x, SolidRect(x * tile_w, y * tile_h, w * tile_w, h * tile_h, tile_h)))
+        colliders.sort(key=lambda entry: entry[:2])
+        return colliders
+
+    def object(self, obj):
+        """The game object for one object record, or None if it has none (e.g. the player spawn)."""
+        tile_w, tile_h = self.tile_w, self.tile_h
         obj_type = (getattr(obj, "type", "") or "").lower()
         obj_name = (getattr(obj, "name", "") or "").lower()
 
         if obj_type == "player" or obj_name == "player":
-            # Place spawn at object's bottom-left
-            px = int(obj.x)
-            py = int(obj.y - obj.height)
-            player_spawn = (px, py)
+            # Only marks the spawn, see player_spawn()
+            return None
         elif obj_type == "fire" or obj_name == "fire":
             fx = int(obj.x)
             # Align using object height if provided, else reasonable default
@@ -677,7 +1846,7 @@ def load_tmx_level(tmx_path, block_size):
             fy = int(obj.y - assumed_h)
             hazard = Fire(fx, fy, 16, assumed_h)
             hazard.on()
-            objects.append(hazard)
+            return hazard
         elif ("trap" in obj_type) or ("trap" in obj_name):
             tx = int(obj.x)
             th = int(getattr(obj, "height", tile_h) or tile_h)
@@ -686,14 +1855,8 @@ def load_tmx_level(tmx_path, block_size):
             # For tile objects (with gid), origin is bottom-left → y - height.
             has_gid = bool(getattr(obj, "gid", None))
             ty = int(obj.y - th) if has_gid else int(obj.y)
-            # Try to find tile image via gid if present in object
-            tile_img = None
-            try:
-                gid = getattr(obj, "gid", None)
-                if gid:
-                    tile_img = tmx.get_tile_image_by_gid(gid)
-            except Exception:
-                tile_img = None
+            # Use the tile image if the object has a gid
+            tile_frame = self.tile_frame(getattr(obj, "gid", None), tw, th)
 
             # Optional respawn_ms property from Tiled
             respawn_ms = None
@@ -704,45 +1867,34 @@ def load_tmx_level(tmx_path, block_size):
                 except Exception:
                     respawn_ms = None
 
-            trap = DisappearingBlock(tx, ty, tw, th, tile_img, respawn_ms=respawn_ms)
-            objects.append(trap)
+            trap = DisappearingBlock(tx, ty, tw, th, tile_frame, respawn_ms=respawn_ms)
+            return trap
         elif ("spike" in obj_type) or ("spike" in obj_name):
             sx = int(obj.x)
             sh = int(getattr(obj, "height", tile_h) or tile_h)
             sw = int(getattr(obj, "width", tile_w) or tile_w)
             has_gid_s = bool(getattr(obj, "gid", None))
             sy = int(obj.y - sh) if has_gid_s else int(obj.y)
-            spike_img = None
-            try:
-                gid = getattr(obj, "gid", None)
-                if gid:
-                    spike_img = tmx.get_tile_image_by_gid(gid)
-            except Exception:
-                spike_img = None
             # Hidden spike if property hidden=true
             hidden = False
             props = getattr(obj, "properties", None)
             if props and str(props.get("hidden", "")).lower() in ("1", "true", "yes"):
                 hidden = True
             orientation = str(props.get("orientation", "up")).lower() if props else "up"
-            spike = HiddenSpike(sx, sy, sw, sh, spike_img, orientation=orientation) if hidden else Spike(sx, sy, sw, sh, spike_img, orientation=orientation)
-            objects.append(spike)
+            spike_frame = self.tile_frame(getattr(obj, "gid", None), sw, sh, flip_v=orientation in ("down", "top"))
+            spike = HiddenSpike(sx, sy, sw, sh, spike_frame, orientation=orientation,
+                                reveal_frames=self.reveal_frames) if hidden else Spike(sx, sy, sw, sh, spike_frame, orientation=orientation)
+            return spike
         elif ("appear" in obj_type) or ("appear" in obj_name):
             ax = int(obj.x)
             ah = int(getattr(obj, "height", tile_h) or tile_h)
             aw = int(getattr(obj, "width", tile_w) or tile_w)
             has_gid_a = bool(getattr(obj, "gid", None))
             ay = int(obj.y - ah) if has_gid_a else int(obj.y)
-            appear_img = None
-            try:
-                gid = getattr(obj, "gid", None)
-                if gid:
-                    appear_img = tmx.get_tile_image_by_gid(gid)
-            except Exception:
-                appear_img = None
-
-            ap = AppearingBlock(ax, ay, aw, ah, appear_img)
-            objects.append(ap)
+            appear_frame = self.tile_frame(getattr(obj, "gid", None), aw, ah)
+
+            ap = AppearingBlock(ax, ay, aw, ah, appear_frame)
+            return ap
         elif (obj_type == "checkpoint") or (obj_name == "checkpoint"):
             cx = int(obj.x)
             ch = int(getattr(obj, "height", 64) or 64)
@@ -750,7 +1902,7 @@ def load_tmx_level(tmx_path, block_size):
             has_gid_c = bool(getattr(obj, "gid", None))
             cy = int(obj.y - ch) if has_gid_c else int(obj.y)
             checkpoint = Checkpoint(cx, cy, cw, ch)
-            objects.append(checkpoint)
+            return checkpoint
         elif (obj_type == "box2") or (obj_name == "box2"):
             bx = int(obj.x)
             bh = int(getattr(obj, "height", tile_h) or tile_h)
@@ -759,7 +1911,7 @@ def load_tmx_level(tmx_path, block_size):
             by = int(obj.y - bh) if has_gid_b else int(obj.y)
             # Always use Box2 asset regardless of gid
             box = Box(bx, by, bw, bh, variant="Box2")
-            objects.append(box)
+            return box
         elif (obj_type == "end") or (obj_name == "end"):
             ex = int(obj.x)
             eh = int(getattr(obj, "height", 64) or 64)
@@ -767,14 +1919,43 @@ def load_tmx_level(tmx_path, block_size):
             has_gid_e = bool(getattr(obj, "gid", None))
             ey = int(obj.y - eh) if has_gid_e else int(obj.y)
             end_obj = End(ex, ey, ew, eh)
-            objects.append(end_obj)
+            return end_obj
+
+        return None
+
 
-    return objects, player_spawn
+def build_level(data, tmx_path, block_size, stream=None):
+    """Build game objects from decoded level data (see decode_tmx).
+
+    Infinite maps and maps wider than STREAM_MIN_WIDTH become a StreamingLevel
+    unless stream says otherwise.
+    """
+    # Tile surfaces are converted for the display
+    get_window()
+    builder = LevelBuilder(data, block_size)
+    if stream is None:
+        stream = data["infinite"] or builder.columns * builder.tile_w > STREAM_MIN_WIDTH
+    # Diagnostics to help verify map type and loading behavior
+    print(f"Loaded TMX: {tmx_path} | infinite={data['infinite']} | size={data['width']}x{data['height']} | "
+          f"tile={data['tile_w']}x{data['tile_h']} | streaming={bool(stream)}")
+    if stream:
+        return StreamingLevel(builder, tmx_path)
+
+    chunks = TileChunks()
+    objects = [collider for _, _, collider in builder.tiles(chunks)]
+    # Objects layer for spawn/hazards/traps
+    for record in builder.records:
+        obj = builder.object(record)
+        if obj is not None:
+            objects.append(obj)
+    return Level(objects, builder.player_spawn(), tmx_path, chunks)
 
 
-def draw(window, background, bg_image, player, objects, offset_x, update_display=True, death_count=None):
-    for tile in background:
-        window.blit(bg_image, tile)
+def draw(window, background, player, objects, offset_x, update_display=True, death_count=None, chunks=None):
+    window.blit(background, (0, 0))
+
+    if chunks is not None:
+        chunks.draw(window, offset_x)
 
     for obj in objects:
         obj.draw(window, offset_x)
@@ -783,51 +1964,188 @@ def draw(window, background, bg_image, player, objects, offset_x, update_display
 
     # HUD: Death counter (top-left)
     if death_count is not None:
-        hud_font = pygame.font.SysFont(None, 28)
-        hud_text = hud_font.render(f"Deaths: {death_count}", True, (255, 255, 255))
-        window.blit(hud_text, (12, 10))
+        window.blit(TEXT.render(f"Deaths: {death_count}", 28), (12, 10))
 
     if update_display:
         pygame.display.update()
 
 
+class DirtyRenderer:
+    """Redraws and presents only the parts of the window that changed.
+
+    Every visible object's image and position is remembered between frames;
+    an object that moved, changed frame, appeared or left the view marks its
+    old and new screen rects dirty, as does the player. Dirty rects are
+    repainted with draw() clipped to them and only they are passed to
+    pygame.display.update(). A camera scroll, a new death count or an
+    invalidate() falls back to one full redraw.
+    """
+
+    def __init__(self):
+        self.invalidate()
+
+    def invalidate(self):
+        """Force the next frame to be redrawn in full, e.g. after an overlay."""
+        self._offset_x = None
+        self._death_count = None
+        self._drawn = {}
+        self._extra_rects = []
+
+    def draw(self, window, background, player, objects, offset_x, death_count=None, chunks=None):
+        """Bring the window up to date; returns the rects that need presenting."""
+        drawn = {}
+        dirty = list(self._extra_rects)
+        previous = self._drawn
+        for sprite in (player, *objects):
+            if sprite is player:
+                x, y = player.render_pos if player.render_pos is not None else player.rect.topleft
+                state = (player.sprite, x, y)
+            else:
+                state = (sprite.image, sprite.rect.x, sprite.rect.y)
+            image, x, y = state
+            old = previous.pop(sprite, None)
+            if old is None or old[0] is not image or old[1] != x or old[2] != y:
+                dirty.append(image.get_rect(topleft=(x - offset_x, y)))
+                if old is not None:
+                    dirty.append(old[0].get_rect(topleft=(old[1] - offset_x, old[2])))
+            drawn[sprite] = state
+        # Objects no longer in view
+        for image, x, y in previous.values():
+            dirty.append(image.get_rect(topleft=(x - offset_x, y)))
+        self._drawn = drawn
+
+        if offset_x != self._offset_x or death_count != self._death_count:
+            self._offset_x = offset_x
+            self._death_count = death_count
+            draw(window, background, player, objects, offset_x, update_display=False, death_count=death_count,
+                 chunks=chunks)
+            return [window.get_rect()]
+
+        screen = window.get_rect()
+        dirty = self._merge([rect.clip(screen) for rect in dirty if rect.colliderect(screen)])
+        for rect in dirty:
+            window.set_clip(rect)
+            draw(window, background, player, objects, offset_x, update_display=False, death_count=death_count,
+                 chunks=chunks)
+        window.set_clip(None)
+        return dirty
+
+    def present(self, rects, extra_rects=()):
+        """Show rects plus extra_rects, which are drawn on top after draw() and
+        must be repainted next frame (e.g. the profiler HUD)."""
+        extra_rects = [rect for rect in extra_rects if rect]
+        pygame.display.update(list(rects) + extra_rects)
+        self._extra_rects = extra_rects
+
+    @staticmethod
+    def _merge(rects):
+        # Union overlapping rects so no area is repainted twice
+        merged = []
+        for rect in rects:
+            i = rect.collidelist(merged)
+            while i != -1:
+                rect = rect.union(merged.pop(i))
+                i = rect.collidelist(merged)
+            merged.append(rect)
+        return merged
+
+
+def _dim_layer(alpha):
+    def build():
+        layer = pygame.Surface((WIDTH, HEIGHT), pygame.SRCALPHA)
+        layer.fill((0, 0, 0, alpha))
+        return layer
+    return TEXT.cached(("dim", alpha), build)
+
+
+def _centered(surface, center):
+    return surface, surface.get_rect(center=center)
+
+
 def draw_restart_overlay(win, message="You Died - Press R to Restart"):
-    overlay = pygame.Surface((WIDTH, HEIGHT), pygame.SRCALPHA)
-    overlay.fill((0, 0, 0, 160))
-    win.blit(overlay, (0, 0))
-    font = pygame.font.SysFont(None, 48)
-    text = font.render(message, True, (255, 255, 255))
-    rect = text.get_rect(center=(WIDTH // 2, HEIGHT // 2))
-    win.blit(text, rect)
+    # Built once per message: a list of (surface, rect) blits
+    overlay = TEXT.cached(("restart_overlay", message), lambda: [
+        (_dim_layer(160), (0, 0)),
+        _centered(TEXT.render(message, 48), (WIDTH // 2, HEIGHT // 2)),
+    ])
+    win.blits(overlay, doreturn=False)
+
+
+# Menu buttons, scaled 3x; their rects double as click targets
+LEADERBOARD_BUTTON_PATH = join("assets", "Menu", "Buttons", "Leaderboard.png")
+LEADERBOARD_BUTTON = pygame.Rect(0, 0, 63, 66)
+LEADERBOARD_BUTTON.center = (WIDTH // 2, HEIGHT // 2 + 160)
+BACK_BUTTON_PATH = join("assets", "Menu", "Buttons", "Back.png")
+BACK_BUTTON = pygame.Rect(40, 40, 45, 48)
+
+
 def draw_level_complete_overlay(win, elapsed_ms, death_count):
-    overlay = pygame.Surface((WIDTH, HEIGHT), pygame.SRCALPHA)
-    overlay.fill((0, 0, 0, 180))
-    win.blit(overlay, (0, 0))
-    title_font = pygame.font.SysFont(None, 56)
-    info_font = pygame.font.SysFont(None, 36)
-    title = title_font.render("Level Complete!", True, (255, 255, 0))
-    sec = max(0.0, elapsed_ms / 1000.0)
-    info1 = info_font.render(f"Time: {sec:.2f}s", True, (255, 255, 255))
-    info2 = info_font.render(f"Deaths: {death_count}", True, (255, 255, 255))
-    info3 = info_font.render("N: Next Level   R: Restart", True, (200, 200, 200))
-    cx, cy = WIDTH // 2, HEIGHT // 2
-    win.blit(title, title.get_rect(center=(cx, cy - 60)))
-    win.blit(info1, info1.get_rect(center=(cx, cy - 10)))
-    win.blit(info2, info2.get_rect(center=(cx, cy + 30)))
-    win.blit(info3, info3.get_rect(center=(cx, cy + 80)))
+    def build():
+        sec = max(0.0, elapsed_ms / 1000.0)
+        cx, cy = WIDTH // 2, HEIGHT // 2
+        return [
+            (_dim_layer(180), (0, 0)),
+            _centered(TEXT.render("Level Complete!", 56, (255, 255, 0)), (cx, cy - 60)),
+            _centered(TEXT.render(f"Time: {sec:.2f}s", 36), (cx, cy - 10)),
+            _centered(TEXT.render(f"Deaths: {death_count}", 36), (cx, cy + 30)),
+            _centered(TEXT.render("N: Next Level   R: Restart   L: Leaderboard", 36, (200, 200, 200)), (cx, cy + 80)),
+            (ASSETS.image(LEADERBOARD_BUTTON_PATH, scale=LEADERBOARD_BUTTON.size), LEADERBOARD_BUTTON),
+        ]
+
+    # Built once per completed run, not once per frame
+    win.blits(TEXT.cached(("complete_overlay", elapsed_ms, death_count), build), doreturn=False)
     pygame.display.update()
 
 
+def draw_leaderboard_overlay(win, level, player, best, history):
+    """Best times on level and player's latest runs, as rows from RunStats."""
+    def build():
+        cx = WIDTH // 2
+        blits = [
+            (_dim_layer(220), (0, 0)),
+            (ASSETS.image(BACK_BUTTON_PATH, scale=BACK_BUTTON.size), BACK_BUTTON),
+            _centered(TEXT.render("Leaderboard", 56, (255, 255, 0)), (cx, 70)),
+            _centered(TEXT.render(os.path.basename(level), 28, (200, 200, 200)), (cx, 115)),
+        ]
+        y = 165
+        if not best:
+            blits.append(_centered(TEXT.render("No finished runs yet", 28), (cx, y)))
+            y += 30
+        for rank, (name, elapsed_ms, deaths, _) in enumerate(best, 1):
+            row = f"{rank:>2}. {name[:16]:<16} {elapsed_ms / 1000:8.2f}s {deaths:>4} deaths"
+            blits.append(_centered(TEXT.render(row, 22, font_name="monospace"), (cx, y)))
+            y += 28
+        y += 30
+        blits.append(_centered(TEXT.render(f"Latest runs by {player}", 36, (255, 255, 0)), (cx, y)))
+        y += 40
+        for run_level, elapsed_ms, deaths, finished_at in history:
+            when = time.strftime("%Y-%m-%d %H:%M", time.localtime(finished_at))
+            row = f"{when}  {os.path.basename(run_level)[:16]:<16} {elapsed_ms / 1000:8.2f}s {deaths:>4} deaths"
+            blits.append(_centered(TEXT.render(row, 22, (200, 200, 200), font_name="monospace"), (cx, y)))
+            y += 28
+        blits.append(_centered(TEXT.render("Esc / L: Back", 28, (200, 200, 200)), (cx, HEIGHT - 40)))
+        return blits
+
+    win.blits(TEXT.cached(("leaderboard", level, player, tuple(best), tuple(history)), build), doreturn=False)
+    pygame.display.update()
 
-def handle_vertical_collision(player, objects, dy):
-    collided_objects = []
-    for obj in objects:
-        # If the object is an appearing block and still invisible (non-solid),
-        # collision mask returns False; but we want it to appear on touch.
+
+def handle_vertical_collision(player, level, dy, area, triggers, solids):
+    # An appearing block is still invisible (non-solid), so the collision
+    # mask won't find it; but we want it to appear on touch, and be solid
+    # by the time solids near area are resolved.
+    appeared = False
+    for obj in triggers:
         if isinstance(obj, AppearingBlock):
-            if pygame.sprite.collide_rect(player, obj):
+            if pygame.sprite.collide_rect(player, obj) and not obj.is_solid:
                 obj.trigger()
-        if getattr(obj, "is_solid", True) and pygame.sprite.collide_mask(player, obj):
+                appeared = True
+    if appeared:
+        solids = level.solids.query(area)
+    collided_objects = []
+    for obj in _tile_rows(solids, area, level.solids.cell_size):
+        # Side probes may have triggered a trap since solids was queried
+        if obj.is_solid and pygame.sprite.collide_mask(player, obj):
             # If it's a disappearing trap, trigger instantly and skip resolving collision
             if isinstance(obj, DisappearingBlock):
                 obj.trigger()
@@ -847,26 +2165,82 @@ def handle_vertical_collision(player, objects, dy):
     return collided_objects
 
 
-def collide(player, objects, dx):
-    player.move(dx, 0)
-    player.update()
-    collided_object = None
+def _tile_order(collider):
+    # Order of per-row tile colliders: by row and column, tiles before runs in a cell
+    return collider.rect.y, collider.rect.x, type(collider) is SolidRect
+
+
+def _tile_rows(solids, area, cell_size):
+    """solids (queried around area) with every multi-row SolidRect split into its rows.
+
+    The result is what querying one collider per row would have returned:
+    rows in the grid cells the query covered, in (row, column) order. A
+    landing or a head bump then snaps to the edge of the row actually
+    overlapped, and a head bump pushes the player down row by row as far as
+    those rows reach. Tiles come before other objects in level order, so
+    those follow unchanged.
+    """
+    for obj in solids:
+        if type(obj) is SolidRect and obj.rect.height > obj.row_height:
+            break
+    else:
+        return solids
+    top = area.top // cell_size * cell_size
+    bottom = ((area.bottom - 1) // cell_size + 1) * cell_size
+    tiles = []
+    others = []
+    sources = 0
+    for obj in solids:
+        if type(obj) is SolidRect:
+            sources += 1
+            for row in obj.rows():
+                if row.rect.bottom > top and row.rect.top < bottom:
+                    tiles.append(row)
+        elif isinstance(obj, TileCollider):
+            sources += 1
+            tiles.append(obj)
+        else:
+            others.append(obj)
+    if sources > 1:
+        tiles.sort(key=_tile_order)
+    tiles.extend(others)
+    return tiles
+
+
+def probe_sides(player, objects, distance):
+    """First objects the player would overlap if moved distance px left and right.
+
+    Tests the player's current mask at both offsets in one pass over objects;
+    the player itself is not moved. Returns (left, right), either may be None.
+    """
+    mask = player.mask
+    px, py = player.rect.topleft
+    left = right = None
     for obj in objects:
-        if pygame.sprite.collide_mask(player, obj):
-            collided_object = obj
+        # Offset of obj relative to the player as it would stand after the move
+        dx = obj.rect.x - px
+        dy = obj.rect.y - py
+        if left is None and mask.overlap(obj.mask, (dx + distance, dy)) is not None:
+            left = obj
+        if right is None and mask.overlap(obj.mask, (dx - distance, dy)) is not None:
+            right = obj
+        if left is not None and right is not None:
             break
+    return left, right
 
-    player.move(-dx, 0)
-    player.update()
-    return collided_object
 
+def handle_move(player, level, keys=None):
+    if keys is None:
+        keys = pygame.key.get_pressed()
 
-def handle_move(player, objects):
-    keys = pygame.key.get_pressed()
+    # Only objects near the player (including the side probes) can collide
+    area = player.rect.inflate(PLAYER_VEL * 4 + 2, 2)
+    solids = level.solids.query(area)
+    # Appearing blocks the player touches before the vertical snap
+    triggers = level.triggers.query(area)
 
     player.x_vel = 0
-    collide_left = collide(player, [o for o in objects if getattr(o, "is_solid", True)], -PLAYER_VEL * 2)
-    collide_right = collide(player, [o for o in objects if getattr(o, "is_solid", True)], PLAYER_VEL * 2)
+    collide_left, collide_right = probe_sides(player, solids, PLAYER_VEL * 2)
 
     # If we would collide with a trap on sides, trigger and ignore the collision immediately
     if isinstance(collide_left, DisappearingBlock):
@@ -881,7 +2255,7 @@ def handle_move(player, objects):
     if keys[pygame.K_RIGHT] and not collide_right:
         player.move_right(PLAYER_VEL)
 
-    vertical_collide = handle_vertical_collision(player, objects, player.y_vel)
+    vertical_collide = handle_vertical_collision(player, level, player.y_vel, area, triggers, solids)
     to_check = [collide_left, collide_right, *vertical_collide]
 
     for obj in to_check:
@@ -908,14 +2282,18 @@ def handle_move(player, objects):
             if isinstance(obj, End):
                 obj.trigger()
 
+    # The vertical snap may have moved the player out of area, so look
+    # around where it ended up
+    area = player.rect.inflate(2, 2)
     # Hazards that are non-solid (e.g., spikes) won't be in to_check; check them directly
-    for obj in objects:
-        if getattr(obj, "name", None) == "spike":
+    for obj in level.hazards.query(area):
+        if obj.name == "spike":
             if pygame.sprite.collide_mask(player, obj) or pygame.sprite.collide_rect(player, obj):
                 if isinstance(obj, HiddenSpike):
                     obj.trigger()
                 player.make_hit()
-        if getattr(obj, "name", None) == "checkpoint":
+    for obj in level.triggers.query(area):
+        if obj.name == "checkpoint":
             # Checkpoints are non-solid, so they won't be in vertical/side collision lists
             if pygame.sprite.collide_mask(player, obj) or pygame.sprite.collide_rect(player, obj):
                 try:
@@ -923,7 +2301,7 @@ def handle_move(player, objects):
                     player.respawn_pos = (obj.rect.x, obj.rect.y)
                 except Exception:
                     pass
-        if getattr(obj, "name", None) == "end":
+        if obj.name == "end":
             if pygame.sprite.collide_mask(player, obj) or pygame.sprite.collide_rect(player, obj):
                 try:
                     obj.trigger()
@@ -952,180 +2330,893 @@ def _find_next_level(current_map):
         return None
 
 
-def main(window, map_path_override=None, death_count_seed=0):
-    clock = pygame.time.Clock()
-    background, bg_image = get_background("Blue.png")
+class LevelPrefetcher:
+    """Finds and decodes the level after the current one on a worker thread.
+
+    Only decoding happens off the main thread (load_level_data needs no
+    display); surfaces and objects are still built by whoever takes the result.
+    One prefetch is kept at a time, for the most recently requested map.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._current_map = None
+        self._thread = None
+        self._result = None
+
+    def request(self, current_map):
+        """Start prefetching the level after current_map unless already under way."""
+        with self._lock:
+            if self._current_map == current_map:
+                return
+            self._current_map = current_map
+            self._result = None
+            self._thread = threading.Thread(target=self._work, args=(current_map,), name="level-prefetch",
+                                            daemon=True)
+            self._thread.start()
+
+    def _work(self, current_map):
+        next_map = _find_next_level(current_map)
+        data = load_level_data(next_map) if next_map else None
+        with self._lock:
+            if self._current_map == current_map:
+                self._result = (next_map, data)
+
+    def take(self, current_map):
+        """(next_map, level_data) for the level after current_map; waits if still loading.
+
+        next_map is None when there is no next level, and level_data is None if
+        it couldn't be decoded.
+        """
+        self.request(current_map)
+        self._thread.join()
+        with self._lock:
+            result = self._result
+            self._current_map = None
+            self._thread = None
+            self._result = None
+        return result if result is not None else (None, None)
+
+
+PREFETCH = LevelPrefetcher()
+
+
+STATS_PATH = join("save", "stats.db")
+
+
+def default_player_name():
+    return os.environ.get("USER") or os.environ.get("USERNAME") or "player"
+
+
+class RunStats:
+    """Local store of finished runs in an SQLite database (WAL mode).
+
+    record() only queues the run; a writer thread commits queued runs in
+    batches on its own connection, so finishing a level never waits on the
+    disk. Queries run on the caller's connection and are all index lookups:
+    runs are indexed by (level, time) for best times and (player, finish
+    time) for history, so they stay fast however many runs are stored. The
+    database is only opened on first use.
+    """
+    # A batch is committed once this many runs are queued or this long after its first run
+    BATCH_SIZE = 256
+    BATCH_WINDOW_S = 0.2
+
+    SCHEMA = """
+        CREATE TABLE IF NOT EXISTS runs (
+            id INTEGER PRIMARY KEY,
+            level TEXT NOT NULL,
+            player TEXT NOT NULL,
+            elapsed_ms INTEGER NOT NULL,
+            deaths INTEGER NOT NULL,
+            finished_at REAL NOT NULL
+        );
+        CREATE INDEX IF NOT EXISTS runs_by_level_time ON runs (level, elapsed_ms, deaths);
+        CREATE INDEX IF NOT EXISTS runs_by_player ON runs (player, finished_at);
+    """
+
+    def __init__(self, path=STATS_PATH):
+        self.path = path
+        self._queue = queue.Queue()
+        self._lock = threading.Lock()
+        self._thread = None
+        self._reader = None
+
+    def _connect(self):
+        if os.path.dirname(self.path):
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        conn = sqlite3.connect(self.path, timeout=10)
+        conn.execute("PRAGMA journal_mode=WAL")
+        # Safe with WAL: a crash can lose the last commits but never corrupts the file
+        conn.execute("PRAGMA synchronous=NORMAL")
+        conn.executescript(self.SCHEMA)
+        return conn
+
+    def record(self, level, player, elapsed_ms, deaths, finished_at=None):
+        """Queue one finished run; returns immediately."""
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._work, name="run-stats", daemon=True)
+                self._thread.start()
+        self._queue.put((level, player, int(elapsed_ms), int(deaths),
+                         time.time() if finished_at is None else finished_at))
+
+    def _work(self):
+        try:
+            conn = self._connect()
+        except (OSError, sqlite3.Error) as e:
+            print("Run stats disabled:", e)
+            conn = None
+        while True:
+            batch = [self._queue.get()]
+            deadline = time.monotonic() + self.BATCH_WINDOW_S
+            while batch[-1] is not None and len(batch) < self.BATCH_SIZE:
+                try:
+                    batch.append(self._queue.get(timeout=max(0.0, deadline - time.monotonic())))
+                except queue.Empty:
+                    break
+            runs = [run for run in batch if run is not None]
+            if runs and conn is not None:
+                try:
+                    with conn:
+                        conn.executemany("INSERT INTO runs (level, player, elapsed_ms, deaths, finished_at) "
+                                         "VALUES (?, ?, ?, ?, ?)", runs)
+                except sqlite3.Error as e:
+                    print("Could not save run stats:", e)
+            for _ in batch:
+                self._queue.task_done()
+            if batch[-1] is None:
+                break
+        if conn is not None:
+            conn.close()
+
+    def flush(self):
+        """Wait until every queued run is committed."""
+        if self._thread is not None:
+            self._queue.join()
+
+    def close(self):
+        """Commit what is queued and stop the writer thread."""
+        with self._lock:
+            thread, self._thread = self._thread, None
+        if thread is not None:
+            self._queue.put(None)
+            thread.join()
+        if self._reader is not None:
+            self._reader.close()
+            self._reader = None
+
+    def _query(self, sql, params=()):
+        if self._reader is None:
+            self._reader = self._connect()
+        return self._reader.execute(sql, params).fetchall()
+
+    def best_times(self, level, limit=10):
+        """Fastest runs on level as (player, elapsed_ms, deaths, finished_at), best first."""
+        return self._query("SELECT player, elapsed_ms, deaths, finished_at FROM runs WHERE level = ? "
+                           "ORDER BY elapsed_ms, deaths LIMIT ?", (level, limit))
+
+    def best_per_level(self):
+        """(level, best elapsed_ms) for every level with a finished run."""
+        # Hops from one level to the next through the index instead of
+        # scanning every run, as GROUP BY would
+        return self._query("""
+            WITH RECURSIVE levels(level) AS (
+                SELECT MIN(level) FROM runs
+                UNION ALL
+                SELECT (SELECT MIN(level) FROM runs WHERE level > levels.level) FROM levels
+                WHERE level IS NOT NULL
+            )
+            SELECT level, (SELECT MIN(elapsed_ms) FROM runs WHERE runs.level = levels.level)
+            FROM levels WHERE level IS NOT NULL""")
+
+    def history(self, player, limit=20):
+        """player's latest runs as (level, elapsed_ms, deaths, finished_at), newest first."""
+        return self._query("SELECT level, elapsed_ms, deaths, finished_at FROM runs WHERE player = ? "
+                           "ORDER BY finished_at DESC LIMIT ?", (player, limit))
+
+
+# Per-tick input bits; one byte fully describes what the player did on a tick
+INPUT_LEFT = 1
+INPUT_RIGHT = 2
+INPUT_JUMP = 4
+INPUT_RESPAWN = 8
+
+
+class InputKeys:
+    """Keyboard-state lookalike (indexable by key code) backed by input bits."""
+
+    def __init__(self, bits=0):
+        self.bits = bits
+
+    def __getitem__(self, key):
+        if key == pygame.K_LEFT:
+            return bool(self.bits & INPUT_LEFT)
+        if key == pygame.K_RIGHT:
+            return bool(self.bits & INPUT_RIGHT)
+        return False
+
+
+class InputRecorder:
+    """Run-length encoded per-tick input bits.
+
+    File layout (little endian): magic, format version, tick rate, map path
+    length and UTF-8 map path, then one (bits: u8, run length: u32) record per
+    run of identical ticks.
+    """
+    MAGIC = b"UPRP"
+    VERSION = 1
+    _HEADER = struct.Struct("<4sBHH")
+    _RUN = struct.Struct("<BI")
+
+    def __init__(self, map_path=None, runs=None):
+        self.map_path = map_path
+        # [bits, count] pairs
+        self.runs = runs if runs is not None else []
+
+    def record(self, bits):
+        if self.runs and self.runs[-1][0] == bits:
+            self.runs[-1][1] += 1
+        else:
+            self.runs.append([bits, 1])
+
+    def __len__(self):
+        return sum(count for _, count in self.runs)
+
+    def save(self, path):
+        map_bytes = (self.map_path or "").encode("utf-8")
+        with open(path, "wb") as f:
+            f.write(self._HEADER.pack(self.MAGIC, self.VERSION, FPS, len(map_bytes)))
+            f.write(map_bytes)
+            for bits, count in self.runs:
+                f.write(self._RUN.pack(bits, count))
+
+    @classmethod
+    def load(cls, path):
+        with open(path, "rb") as f:
+            data = f.read()
+        magic, version, tick_rate, map_len = cls._HEADER.unpack_from(data, 0)
+        if magic != cls.MAGIC or version != cls.VERSION:
+            raise ValueError(f"Not a replay file: {path}")
+        if tick_rate != FPS:
+            print(f"Replay recorded at {tick_rate} ticks/s, playing at {FPS}")
+        pos = cls._HEADER.size
+        map_path = data[pos:pos + map_len].decode("utf-8") or None
+        pos += map_len
+        runs = [list(run) for run in cls._RUN.iter_unpack(data[pos:])]
+        return cls(map_path, runs)
+
+
+class InputReplay:
+    """Feeds recorded input bits back one tick at a time."""
+
+    def __init__(self, recording):
+        self.map_path = recording.map_path
+        self._runs = recording.runs
+        self._run = 0
+        self._used = 0
+
+    def __len__(self):
+        return sum(count for _, count in self._runs)
+
+    @property
+    def done(self):
+        return self._run >= len(self._runs)
+
+    def next(self):
+        if self.done:
+            return 0
+        bits, count = self._runs[self._run]
+        self._used += 1
+        if self._used >= count:
+            self._run += 1
+            self._used = 0
+        return bits
+
+
+class FrameProfiler:
+    """Per-phase wall-clock timings of the main loop.
+
+    start() opens a measurement and each mark(phase) charges the time since the
+    previous mark to that phase; end_frame() closes one rendered frame, which may
+    span several simulation ticks. Rolling averages and p99 feed the F3 HUD, and
+    every frame can be streamed to a CSV file. While disabled every call returns
+    immediately.
+    """
+    PHASES = ("player", "objects", "move", "hazards", "draw", "present")
+    WINDOW = 240
+    # Recompute HUD statistics every this many frames
+    HUD_REFRESH = 15
+
+    def __init__(self, enabled=False, csv_path=None):
+        self.enabled = enabled or csv_path is not None
+        self.show_hud = enabled
+        self.history = {phase: deque(maxlen=self.WINDOW) for phase in self.PHASES + ("total",)}
+        self.frames = 0
+        self._t = 0.0
+        self._current = dict.fromkeys(self.PHASES, 0.0)
+        self._steps = 0
+        # Rendered HUD lines; they change every refresh, so they bypass TEXT
+        self._hud_images = []
+        self._csv_file = None
+        self._csv = None
+        if csv_path:
+            self._csv_file = open(csv_path, "w", newline="")
+            self._csv = csv.writer(self._csv_file)
+            self._csv.writerow(["frame", "ticks"] + [f"{phase}_ms" for phase in self.PHASES] + ["total_ms"])
+
+    def toggle_hud(self):
+        self.show_hud = not self.show_hud
+        if self.show_hud:
+            self.enabled = True
+        elif self._csv is None:
+            self.enabled = False
+
+    def start(self):
+        if self.enabled:
+            self._t = time.perf_counter()
+
+    def mark(self, phase):
+        if self.enabled:
+            now = time.perf_counter()
+            self._current[phase] += now - self._t
+            self._t = now
+
+    def tick(self):
+        if self.enabled:
+            self._steps += 1
+
+    def end_frame(self):
+        if not self.enabled:
+            return
+        current = self._current
+        total = 0.0
+        for phase in self.PHASES:
+            ms = current[phase] * 1000.0
+            self.history[phase].append(ms)
+            total += ms
+        self.history["total"].append(total)
+        if self._csv is not None:
+            self._csv.writerow([self.frames, self._steps] + [f"{current[p] * 1000.0:.4f}" for p in self.PHASES]
+                               + [f"{total:.4f}"])
+        self.frames += 1
+        self._steps = 0
+        for phase in self.PHASES:
+            current[phase] = 0.0
+        if self.show_hud and self.frames % self.HUD_REFRESH == 0:
+            font = TEXT.font(14, "monospace")
+            self._hud_images = [
+                font.render(f"{name:<8}{avg:7.2f} avg {p99:7.2f} p99 ms", True, (255, 255, 255), (0, 0, 0))
+                for name, (avg, p99) in self.stats().items()]
+
+    def stats(self):
+        """Rolling (average, p99) milliseconds per phase."""
+        result = {}
+        for phase, samples in self.history.items():
+            if not samples:
+                continue
+            ordered = sorted(samples)
+            result[phase] = (sum(ordered) / len(ordered), ordered[min(len(ordered) - 1, int(len(ordered) * 0.99))])
+        return result
+
+    def draw_hud(self, win, pos=(150, 12)):
+        """Draw the HUD if shown; returns the rect it covered, or None."""
+        if not self.show_hud:
+            return None
+        x, y = pos
+        covered = pygame.Rect(x, y, 0, 0)
+        for image in self._hud_images:
+            covered.union_ip(win.blit(image, (x, y)))
+            y += 16
+        return covered
+
+    def close(self):
+        if self._csv_file is not None:
+            self._csv_file.close()
+            self._csv_file = None
+            self._csv = None
+
+
+def replay_path_for(map_path):
+    # Recordings live next to the map they were played on
+    return os.path.splitext(map_path)[0] + ".replay"
+
 
-    block_size = 96
+def save_atlas():
+    try:
+        ASSETS.save_atlas(ATLAS_DIR)
+    except (OSError, pygame.error) as e:
+        print("Could not write sprite atlas:", e)
+
+
+def build_atlas(map_paths):
+    """Pack the player sprites and every sprite used by map_paths into the atlas."""
+    load_sprite_sheets("MainCharacters", "MaskDude", 32, 32, True)
+    for map_path in map_paths:
+        # Built in full so every object's sprites are loaded
+        load_tmx_level(map_path, 96, stream=False)
+    save_atlas()
+    return ASSETS.stats()
 
+
+def resolve_map_path(map_path_override=None):
     # Try loading a TMX map if available. Prefer map/Level1.tmx unless override is given.
     if map_path_override and os.path.exists(map_path_override):
-        map_path = map_path_override
-    else:
-        preferred_map = os.path.join("map", "Level1.tmx")
-        if os.path.exists(preferred_map):
-            map_path = preferred_map
+        return map_path_override
+    preferred_map = os.path.join("map", "Level1.tmx")
+    if os.path.exists(preferred_map):
+        return preferred_map
+    test_map = os.path.join("levels", "test.tmx")
+    level1_map = os.path.join("levels", "level1.tmx")
+    return test_map if os.path.exists(test_map) else level1_map
+
+
+def build_fallback_level(block_size):
+    # Hardcoded layout used when no TMX map can be loaded
+    fire = Fire(100, HEIGHT - block_size - 64, 16, 32)
+    fire.on()
+    floor = [Block(i * block_size, HEIGHT - block_size, block_size)
+             for i in range(-WIDTH // block_size, (WIDTH * 2) // block_size)]
+    return Level([*floor, Block(0, HEIGHT - block_size * 2, block_size),
+                  Block(block_size * 3, HEIGHT - block_size * 4, block_size), fire])
+
+
+class GameSession:
+    """One play-through of a level, simulated at a fixed timestep.
+
+    step() advances the game by exactly one SIM_DT_MS tick, independent of how
+    often the screen is redrawn; render() draws the latest state with the
+    player and camera interpolated between the last two ticks. restart() and
+    load_level() start over in place, reusing the built level where possible.
+    """
+    COMPLETE_OVERLAY_DELAY_MS = 1500
+    SCROLL_AREA_WIDTH = 200
+    # Rows of best times and of history that fit on the leaderboard overlay
+    LEADERBOARD_ROWS = 8
+
+    def __init__(self, window, map_path_override=None, death_count_seed=0, record=False, replay=None,
+                 profiler=None, level_data=None, full_redraw=False, stream=None, stats=None, player_name=None):
+        self.window = window
+        self.profiler = profiler if profiler is not None else FrameProfiler()
+        self.background = get_background("Blue.png")
+        # Present only changed regions unless asked to redraw every frame
+        self.renderer = None if full_redraw else DirtyRenderer()
+        self.block_size = 96
+        # None streams only large and infinite maps, see build_level
+        self.stream = stream
+        self.record = record
+        self.death_count = int(death_count_seed or 0)
+        # Finished runs go to stats (a RunStats), which also backs the leaderboard
+        self.stats = stats
+        self.player_name = player_name or default_player_name()
+
+        if replay is not None and not map_path_override:
+            map_path_override = replay.map_path
+        self.load_level(map_path_override, level_data, replay=replay)
+
+    def load_level(self, map_path_override=None, level_data=None, replay=None):
+        """Switch to another map and start it from the beginning."""
+        self.map_path = resolve_map_path(map_path_override)
+        if level_data is not None:
+            # Already decoded, e.g. by PREFETCH
+            self.level = build_level(level_data, self.map_path, self.block_size, self.stream)
         else:
-            test_map = os.path.join("levels", "test.tmx")
-            level1_map = os.path.join("levels", "level1.tmx")
-            map_path = test_map if os.path.exists(test_map) else level1_map
-    loaded_objects, player_spawn = load_tmx_level(map_path, block_size)
-
-    if loaded_objects is not None:
-        objects = loaded_objects
-        spawn_x, spawn_y = player_spawn if player_spawn else (100, 100)
-        player = Player(spawn_x, spawn_y, 50, 50)
-    else:
-        # Fallback to current hardcoded layout
-        player = Player(100, 100, 50, 50)
-        fire = Fire(100, HEIGHT - block_size - 64, 16, 32)
-        fire.on()
-        floor = [Block(i * block_size, HEIGHT - block_size, block_size)
-                 for i in range(-WIDTH // block_size, (WIDTH * 2) // block_size)]
-        objects = [*floor, Block(0, HEIGHT - block_size * 2, block_size),
-                   Block(block_size * 3, HEIGHT - block_size * 4, block_size), fire]
-
-    offset_x = 0
-    scroll_area_width = 200
-
-    dead = False
-    dead_at_ms = 0
-    death_delay_ms = 0
-    death_cause = None
-    death_count = int(death_count_seed or 0)
-    level_started_ms = pygame.time.get_ticks()
-    level_complete = False
-    level_completed_at_ms = 0
-    elapsed_at_complete_ms = 0
-    complete_overlay_delay_ms = 1500
-    run = True
-    while run:
-        clock.tick(FPS)
-
-        for event in pygame.event.get():
-            if event.type == pygame.QUIT:
-                run = False
-                break
+            self.level = load_tmx_level(self.map_path, self.block_size, self.stream)
+        if self.level is None:
+            self.level = build_fallback_level(self.block_size)
+        if ASSETS.atlas_stale:
+            # First run, or new sprites: pack them so the next start loads them in one go
+            save_atlas()
+        startup_mark("level")
+        # Have the next level ready by the time this one is finished
+        PREFETCH.request(self.map_path)
+        self.restart(replay)
+
+    def restart(self, replay=None):
+        """Start the current level over, keeping the death count.
+
+        The built level is reset in place rather than reloaded, so this costs
+        about as much as a respawn.
+        """
+        # Game time only advances with simulation ticks
+        self.clock = SimClock()
+        set_clock(self.clock)
+        self.level.reset()
+        if self.renderer is not None:
+            self.renderer.invalidate()
+        spawn_x, spawn_y = self.level.player_spawn if self.level.player_spawn else (100, 100)
+        self.player = Player(spawn_x, spawn_y, 50, 50)
+
+        self.offset_x = 0
+        # State at the previous tick, used to interpolate rendering
+        self.prev_offset_x = 0
+        self.prev_player_pos = self.player.rect.topleft
+        self.ticks = 0
+        self.pending_jumps = 0
+        self.respawn_requested = False
+        # Every tick's input bits go through recorder; replay overrides live input
+        self.recorder = InputRecorder(self.map_path) if self.record else None
+        self.replay = replay
+
+        self.dead = False
+        self.dead_at_ms = 0
+        self.death_delay_ms = 0
+        self.death_cause = None
+        self.level_started_ms = get_ticks()
+        self.level_complete = False
+        self.level_completed_at_ms = 0
+        self.elapsed_at_complete_ms = 0
+        self.deaths_at_start = self.death_count
+        # (best times, history) while the leaderboard is shown over the complete overlay
+        self.leaderboard = None
+
+    def toggle_leaderboard(self):
+        if self.leaderboard is not None or self.stats is None:
+            self.leaderboard = None
+            return
+        # The run just finished may still be queued
+        self.stats.flush()
+        self.leaderboard = (self.stats.best_times(self.stats_level(), self.LEADERBOARD_ROWS),
+                            self.stats.history(self.player_name, self.LEADERBOARD_ROWS))
 
-            if event.type == pygame.KEYDOWN:
-                if dead and event.key == pygame.K_r:
-                    # Respawn at last checkpoint rather than reload level
-                    dead = False
-                    player.respawn()
-                    # Reset dynamic objects to initial state
-                    for obj in objects:
-                        reset_fn = getattr(obj, "reset", None)
-                        if callable(reset_fn):
-                            reset_fn()
-                    # Recenter camera on player after respawn
-                    offset_x = max(0, player.rect.centerx - WIDTH // 2)
-                    # Clear any death timers
-                    dead_at_ms = 0
-                    death_delay_ms = 0
-                    death_cause = None
-                    continue
-                if level_complete:
-                    if event.key == pygame.K_r:
-                        # Restart same level with same death_count
-                        return main(window, map_path_override=map_path, death_count_seed=death_count)
-                    if event.key == pygame.K_n:
-                        next_map = _find_next_level(map_path)
-                        if next_map and os.path.exists(next_map):
-                            return main(window, map_path_override=next_map, death_count_seed=death_count)
-                        else:
-                            # If no next level, restart current
-                            return main(window, map_path_override=map_path, death_count_seed=death_count)
-                if (not dead) and event.key == pygame.K_SPACE and player.jump_count < 2:
-                    player.jump()
-
-        if not dead and (not level_complete or (pygame.time.get_ticks() - level_completed_at_ms < complete_overlay_delay_ms)):
+    def stats_level(self):
+        return os.path.normpath(self.map_path)
+
+    def handle_event(self, event):
+        """Apply one input event; returns "quit", "restart" or "next" to leave the level."""
+        if event.type == pygame.QUIT:
+            return "quit"
+
+        if event.type == pygame.KEYDOWN and event.key == pygame.K_F3:
+            self.profiler.toggle_hud()
+            return None
+
+        if event.type == pygame.MOUSEBUTTONDOWN and event.button == 1 and self.level_complete:
+            button = BACK_BUTTON if self.leaderboard is not None else LEADERBOARD_BUTTON
+            if button.collidepoint(event.pos):
+                self.toggle_leaderboard()
+            return None
+
+        if event.type == pygame.KEYDOWN:
+            if self.dead and event.key == pygame.K_r:
+                # Applied on the next simulation tick so it is recorded
+                self.respawn_requested = True
+                return None
+            if self.level_complete:
+                if event.key == pygame.K_l or (event.key == pygame.K_ESCAPE and self.leaderboard is not None):
+                    self.toggle_leaderboard()
+                    return None
+                if event.key == pygame.K_r:
+                    return "restart"
+                if event.key == pygame.K_n:
+                    return "next"
+            if (not self.dead) and event.key == pygame.K_SPACE:
+                # Applied on the next simulation tick
+                self.pending_jumps += 1
+        return None
+
+    def respawn(self):
+        # Respawn at last checkpoint rather than reload level
+        self.dead = False
+        self.player.respawn()
+        # Reset dynamic objects to initial state
+        self.level.reset()
+        # Recenter camera on player after respawn
+        self.offset_x = max(0, self.player.rect.centerx - WIDTH // 2)
+        # Clear any death timers
+        self.dead_at_ms = 0
+        self.death_delay_ms = 0
+        self.death_cause = None
+        # Don't interpolate across the teleport
+        self.prev_offset_x = self.offset_x
+        self.prev_player_pos = self.player.rect.topleft
+
+    def respawn_due(self):
+        # Death delay (e.g. spike reveal) is over and the restart overlay is up
+        return self.dead and not (
+            self.death_cause == "spike" and get_ticks() - self.dead_at_ms < self.death_delay_ms)
+
+    def _overlay_pending(self):
+        return get_ticks() - self.level_completed_at_ms < self.COMPLETE_OVERLAY_DELAY_MS
+
+    def step(self, keys=None):
+        """Advance one tick from live input; keys defaults to the keyboard state."""
+        if self.replay is not None:
+            bits = self.replay.next()
+        else:
+            if keys is None:
+                keys = pygame.key.get_pressed()
+            bits = (INPUT_LEFT if keys[pygame.K_LEFT] else 0) | (INPUT_RIGHT if keys[pygame.K_RIGHT] else 0)
+            # At most one queued jump per tick keeps every tick describable by its bits
+            if self.pending_jumps:
+                self.pending_jumps -= 1
+                bits |= INPUT_JUMP
+            if self.respawn_requested:
+                self.respawn_requested = False
+                bits |= INPUT_RESPAWN
+        self.step_input(bits)
+
+    def step_input(self, bits):
+        """Advance one tick with the given INPUT_* bits."""
+        if self.recorder is not None:
+            self.recorder.record(bits)
+        if bits & INPUT_RESPAWN and self.dead:
+            self.respawn()
+
+        player = self.player
+        level = self.level
+        profiler = self.profiler
+        profiler.start()
+        profiler.tick()
+        keys = InputKeys(bits)
+        self.prev_offset_x = self.offset_x
+        self.prev_player_pos = player.rect.topleft
+        self.ticks += 1
+        self.clock.advance(SIM_DT_MS)
+        camera = camera_rect(self.offset_x)
+
+        if bits & INPUT_JUMP and not self.dead and player.jump_count < 2:
+            player.jump()
+
+        if not self.dead and (not self.level_complete or self._overlay_pending()):
             player.loop(FPS)
-            # Update per-object behavior (Fire, DisappearingBlock, etc.)
-            for obj in objects:
-                if hasattr(obj, "loop"):
-                    if obj is player:
-                        continue
-                    obj.loop()
-            handle_move(player, objects)
+            profiler.mark("player")
+            # Update objects with pending time-dependent work (Fire, triggered traps, etc.)
+            level.update(camera)
+            profiler.mark("objects")
+            handle_move(player, level, keys)
+            profiler.mark("move")
 
             # Death conditions
             fell_off = player.rect.top > HEIGHT + 50
-            # Detect spike contact explicitly to set delay
-            spike_contact = False
-            fire_contact = False
-            for obj in objects:
-                if getattr(obj, "name", None) == "spike":
-                    if pygame.sprite.collide_mask(player, obj) or pygame.sprite.collide_rect(player, obj):
-                        spike_contact = True
-                        break
-            if not spike_contact:
-                for obj in objects:
-                    if getattr(obj, "name", None) == "fire":
-                        if pygame.sprite.collide_mask(player, obj):
-                            fire_contact = True
-                            break
-
             hazard_hit = player.hit  # maintained from collision handlers
             if fell_off or hazard_hit:
-                dead = True
-                death_count += 1
-                death_cause = "spike" if spike_contact else ("fire" if fire_contact else ("fall" if fell_off else "hazard"))
-                dead_at_ms = pygame.time.get_ticks()
-                death_delay_ms = 1001 if death_cause == "spike" else 0
+                # Detect spike contact explicitly to set delay
+                spike_contact = False
+                fire_contact = False
+                nearby = level.hazards.query(player.rect)
+                for obj in nearby:
+                    if obj.name == "spike":
+                        if pygame.sprite.collide_mask(player, obj) or pygame.sprite.collide_rect(player, obj):
+                            spike_contact = True
+                            break
+                if not spike_contact:
+                    for obj in nearby:
+                        if obj.name == "fire":
+                            if pygame.sprite.collide_mask(player, obj):
+                                fire_contact = True
+                                break
+
+                self.dead = True
+                self.death_count += 1
+                self.death_cause = "spike" if spike_contact else ("fire" if fire_contact else ("fall" if fell_off else "hazard"))
+                self.dead_at_ms = get_ticks()
+                self.death_delay_ms = 1001 if self.death_cause == "spike" else 0
             # Check end condition
-            if not level_complete:
-                for obj in objects:
-                    if getattr(obj, "name", None) == "end" and isinstance(obj, End) and obj.activated:
-                        level_complete = True
-                        level_completed_at_ms = pygame.time.get_ticks()
-                        elapsed_at_complete_ms = level_completed_at_ms - level_started_ms
+            if not self.level_complete:
+                for obj in level.ends:
+                    if obj.activated:
+                        self.level_complete = True
+                        self.level_completed_at_ms = get_ticks()
+                        self.elapsed_at_complete_ms = self.level_completed_at_ms - self.level_started_ms
+                        PREFETCH.request(self.map_path)
+                        if self.stats is not None and self.replay is None:
+                            # Queued for the writer thread, so this tick doesn't wait on the disk
+                            self.stats.record(self.stats_level(), self.player_name, self.elapsed_at_complete_ms,
+                                              self.death_count - self.deaths_at_start)
                         break
+            profiler.mark("hazards")
+        elif self.dead:
+            # Dead state - handle spike death delay
+            elapsed_since_death = get_ticks() - self.dead_at_ms
+            if self.death_cause == "spike" and elapsed_since_death < self.death_delay_ms:
+                # Let hazards (e.g., hidden spikes) finish their reveal animation
+                level.update(camera)
+                profiler.mark("objects")
+                # Keep player frozen but show hit pose
+                player.x_vel = 0
+                player.y_vel = 0
+                player.make_hit()
+                player.update_sprite()
+        elif self.level_complete:
+            # After delay: lock player while the overlay is shown
+            player.x_vel = 0
+            player.y_vel = 0
+
+        if ((player.rect.right - self.offset_x >= WIDTH - self.SCROLL_AREA_WIDTH) and player.x_vel > 0) or (
+                (player.rect.left - self.offset_x <= self.SCROLL_AREA_WIDTH) and player.x_vel < 0):
+            self.offset_x += player.x_vel
+
+    def render(self, alpha=1.0):
+        """Draw the current state, blending positions alpha of the way from the previous tick."""
+        player = self.player
+        level = self.level
+        profiler = self.profiler
+        profiler.start()
+        offset_x = round(self.prev_offset_x + (self.offset_x - self.prev_offset_x) * alpha)
+        prev_x, prev_y = self.prev_player_pos
+        player.render_pos = (round(prev_x + (player.rect.x - prev_x) * alpha),
+                             round(prev_y + (player.rect.y - prev_y) * alpha))
+        visible = level.visible(camera_rect(offset_x))
+
+        show_restart = self.respawn_due()
+        show_complete = not self.dead and self.level_complete and not self._overlay_pending()
+        renderer = self.renderer
+        if renderer is not None and not (show_restart or show_complete):
+            rects = renderer.draw(self.window, self.background, player, visible, offset_x,
+                                  death_count=self.death_count, chunks=level.chunks)
+            hud_rect = profiler.draw_hud(self.window)
+            profiler.mark("draw")
+            renderer.present(rects, [hud_rect])
+            profiler.mark("present")
+            return
 
-            draw(window, background, bg_image, player, objects, offset_x, death_count=death_count)
+        if renderer is not None:
+            # Overlays cover the whole window; start over once they are gone
+            renderer.invalidate()
+        draw(self.window, self.background, player, visible, offset_x,
+             update_display=False, death_count=self.death_count, chunks=level.chunks)
+        profiler.draw_hud(self.window)
+        if show_restart:
+            # Show restart overlay and wait for R
+            draw_restart_overlay(self.window)
+        profiler.mark("draw")
+        if show_complete and self.leaderboard is not None:
+            draw_leaderboard_overlay(self.window, self.stats_level(), self.player_name, *self.leaderboard)
+        elif show_complete:
+            draw_level_complete_overlay(self.window, self.elapsed_at_complete_ms, self.death_count)
         else:
-            if dead:
-                # Dead state - handle spike death delay
-                elapsed_since_death = pygame.time.get_ticks() - dead_at_ms
-                if death_cause == "spike" and elapsed_since_death < death_delay_ms:
-                    # Let hazards (e.g., hidden spikes) finish their reveal animation
-                    for obj in objects:
-                        if hasattr(obj, "loop") and obj is not player:
-                            obj.loop()
-                    # Keep player frozen but show hit pose
-                    player.x_vel = 0
-                    player.y_vel = 0
-                    player.make_hit()
-                    player.update_sprite()
-                    # Redraw scene without overlay yet
-                    draw(window, background, bg_image, player, objects, offset_x, death_count=death_count)
-                else:
-                    # Show restart overlay and wait for R
-                    draw(window, background, bg_image, player, objects, offset_x, update_display=False, death_count=death_count)
-                    draw_restart_overlay(window)
-                    pygame.display.update()
-            elif level_complete:
-                # Before overlay: allow normal update including player movement
-                if pygame.time.get_ticks() - level_completed_at_ms < complete_overlay_delay_ms:
-                    # Already updated above in the main branch; just draw
-                    pass
-                else:
-                    # After delay: lock player and show overlay
-                    player.x_vel = 0
-                    player.y_vel = 0
-                draw(window, background, bg_image, player, objects, offset_x, update_display=False, death_count=death_count)
-                now = pygame.time.get_ticks()
-                if now - level_completed_at_ms >= complete_overlay_delay_ms:
-                    draw_level_complete_overlay(window, elapsed_at_complete_ms, death_count)
-                else:
-                    pygame.display.update()
-
-        if ((player.rect.right - offset_x >= WIDTH - scroll_area_width) and player.x_vel > 0) or (
-                (player.rect.left - offset_x <= scroll_area_width) and player.x_vel < 0):
-            offset_x += player.x_vel
+            pygame.display.update()
+        profiler.mark("present")
+
+    def save_recording(self):
+        if self.recorder is not None and len(self.recorder):
+            path = replay_path_for(self.map_path)
+            self.recorder.save(path)
+            print(f"Saved replay: {path} ({len(self.recorder)} ticks)")
+
+    def run(self):
+        """Play until the level is left; returns "quit", "restart" or "next"."""
+        clock = pygame.time.Clock()
+        accumulator = 0.0
+        while True:
+            # Cap how much wall time one frame may add so a long stall can't
+            # trigger an endless catch-up spiral
+            accumulator += min(clock.tick(MAX_RENDER_FPS), MAX_FRAME_TIME_MS)
+
+            for event in pygame.event.get():
+                if event.type == pygame.VIDEOEXPOSE and self.renderer is not None:
+                    self.renderer.invalidate()
+                if self.replay is not None and event.type != pygame.QUIT and not (
+                        event.type == pygame.KEYDOWN and event.key == pygame.K_F3):
+                    # Recorded input drives the game; only closing the window or the HUD toggle count
+                    continue
+                action = self.handle_event(event)
+                if action is not None:
+                    return action
+            if self.replay is not None and self.replay.done:
+                return "quit"
+
+            # Run every simulation tick that is due before drawing once, so a
+            # slow frame drops rendered frames instead of slowing the game down
+            while accumulator >= SIM_DT_MS:
+                self.step()
+                accumulator -= SIM_DT_MS
+
+            if self.ticks:
+                self.render(accumulator / SIM_DT_MS)
+                self.profiler.end_frame()
+                if "first_frame" not in STARTUP_MS:
+                    startup_mark("first_frame")
+                    print("Time to first frame:", ", ".join(f"{name} {ms:.0f} ms" for name, ms in STARTUP_MS.items()))
+
+
+def run_headless(map_path=None, frames=None, script=None, replay=None, auto_respawn=True, stream=None):
+    """Simulate a level without a display or frame cap, as fast as the CPU allows.
+
+    Input comes from replay (an InputReplay) or script(tick), which returns the
+    INPUT_* bits for that tick; with neither, nothing is pressed. frames
+    defaults to the replay length, or one minute of game time. Returns a dict
+    of run statistics.
+    """
+    if frames is None:
+        frames = len(replay) if replay is not None else FPS * 60
+    session = GameSession(get_window(), map_path, replay=replay, stream=stream)
+    completed_at_tick = None
+    started = time.perf_counter()
+    for tick in range(frames):
+        if replay is not None:
+            session.step()
+        else:
+            bits = script(tick) if script is not None else 0
+            if auto_respawn and session.respawn_due():
+                bits |= INPUT_RESPAWN
+            session.step_input(bits)
+        if session.level_complete and completed_at_tick is None:
+            completed_at_tick = tick
+    elapsed = time.perf_counter() - started
+    return {
+        "map": session.map_path,
+        "frames": frames,
+        "seconds": elapsed,
+        "fps": frames / elapsed if elapsed > 0 else float("inf"),
+        "deaths": session.death_count,
+        "completed_at_tick": completed_at_tick,
+        "final_pos": session.player.rect.topleft,
+    }
+
+
+def main(window, map_path_override=None, death_count_seed=0, record=False, replay=None, profiler=None,
+         full_redraw=False, stream=None, player_name=None):
+    stats = RunStats(STATS_PATH)
+    session = GameSession(window, map_path_override, death_count_seed, record=record, replay=replay,
+                          profiler=profiler, full_redraw=full_redraw, stream=stream, stats=stats,
+                          player_name=player_name)
+    while True:
+        action = session.run()
+        session.save_recording()
+        if action == "restart":
+            # Restart same level with same death_count
+            session.restart()
+        elif action == "next":
+            # Normally decoded in the background while the level was being played
+            next_map, next_data = PREFETCH.take(session.map_path)
+            if next_map and os.path.exists(next_map):
+                session.load_level(next_map, next_data)
+            else:
+                # If no next level, restart current
+                session.restart()
+        else:
+            break
 
+    session.profiler.close()
+    stats.close()
     pygame.quit()
     quit()
 
 
 if __name__ == "__main__":
-    main(window)
+    import argparse
+
+    parser = argparse.ArgumentParser(description="The Unfair Platformer")
+    parser.add_argument("--map", help="TMX map to start on")
+    parser.add_argument("--headless", action="store_true",
+                        help="simulate without a display or frame cap and print statistics")
+    parser.add_argument("--frames", type=int,
+                        help="ticks to simulate in headless mode (default: replay length or one minute)")
+    parser.add_argument("--record", action="store_true",
+                        help="record per-tick input next to the map as <map>.replay")
+    parser.add_argument("--replay", help="play back a recorded .replay file")
+    parser.add_argument("--profile", action="store_true", help="start with the F3 frame profiler HUD shown")
+    parser.add_argument("--profile-csv", metavar="PATH", help="stream per-frame phase timings to a CSV file")
+    parser.add_argument("--build-atlas", action="store_true",
+                        help="pack the sprites used by --map (default: every map in map/) into the atlas and exit")
+    parser.add_argument("--full-redraw", action="store_true",
+                        help="redraw and present the whole window every frame instead of only changed regions")
+    parser.add_argument("--stream", action="store_const", const=True,
+                        help="build the level around the camera as it moves, even for small maps")
+    parser.add_argument("--player", help="name finished runs are saved under (default: login name)")
+    parser.add_argument("--leaderboard", action="store_true",
+                        help="print the best time on every level and --player's latest runs, then exit")
+    args = parser.parse_args()
+
+    replay = InputReplay(InputRecorder.load(args.replay)) if args.replay else None
+    if args.leaderboard:
+        stats = RunStats(STATS_PATH)
+        player = args.player or default_player_name()
+        for level, elapsed_ms in stats.best_per_level():
+            print(f"{level:<40} {elapsed_ms / 1000:8.2f}s")
+        print(f"Latest runs by {player}:")
+        for level, elapsed_ms, deaths, finished_at in stats.history(player):
+            print(f"  {time.strftime('%Y-%m-%d %H:%M', time.localtime(finished_at))}  {level:<40} "
+                  f"{elapsed_ms / 1000:8.2f}s {deaths:>4} deaths")
+        stats.close()
+    elif args.build_atlas:
+        maps = [args.map] if args.map else sorted(join("map", f) for f in listdir("map") if f.endswith(".tmx"))
+        print(build_atlas(maps))
+    elif args.headless:
+        print(run_headless(args.map, args.frames, replay=replay, stream=args.stream))
+    else:
+        main(get_window(), map_path_override=args.map, record=args.record, replay=replay,
+             profiler=FrameProfiler(args.profile, args.profile_csv), full_redraw=args.full_redraw,
+             stream=args.stream, player_name=args.player)
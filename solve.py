@@ -0,0 +1,388 @@
+"""Automated solvability check for the levels.
+
+Runs a breadth-first search over input sequences against the headless,
+fixed-timestep simulation (GameSession.step_input: Player.loop, the object
+updates and handle_move) and reports for each level whether its End can be
+reached, the shortest input trace found and the search throughput:
+
+    python solve.py                      # map/Level1.tmx and every LevelN after it
+    python solve.py --map map/Level2.tmx --workers 4 --save-replays
+
+The bot picks one of ACTIONS every --hold ticks (a jump is pressed on the
+first tick only). The search frontier is spread across worker processes,
+each holding its own copy of the level and snapshots of the states it owns;
+the parent prunes states already seen at a shallower or equal depth, so the
+first trace to reach the End is the shortest at --hold granularity. Dying
+ends a branch. Even with duplicates pruned the frontier grows too fast for an
+exhaustive search of a whole level, so by default only the --beam states
+closest to the End are kept per step; a level is only reported NOT solvable
+when nothing was cut (--beam 0), otherwise no solution was found.
+"""
+import argparse
+import json
+import multiprocessing
+import os
+import sys
+import time
+from os.path import abspath, dirname
+
+ROOT = dirname(abspath(__file__))
+
+# The solver never opens a window; main reads this at import time
+os.environ["PLATFORMER_HEADLESS"] = "1"
+sys.path.insert(0, ROOT)
+from main import INPUT_JUMP, INPUT_LEFT, INPUT_RIGHT  # noqa: E402
+
+# (name, input bits held for the whole step)
+ACTIONS = (
+    ("idle", 0),
+    ("left", INPUT_LEFT),
+    ("right", INPUT_RIGHT),
+    ("jump", INPUT_JUMP),
+    ("left+jump", INPUT_LEFT | INPUT_JUMP),
+    ("right+jump", INPUT_RIGHT | INPUT_JUMP),
+)
+JUMP = INPUT_JUMP
+
+ALIVE, DEAD, COMPLETE = 0, 1, 2
+
+
+class Sim:
+    """A headless GameSession whose mutable state can be saved and restored.
+
+    Only the player, the session itself and the objects with loop() or
+    reset() ever change, so a snapshot is a shallow copy of their attributes
+    (rects copied, images shared) plus the clock and the scheduler. Most
+    objects are untouched between snapshots, so their saved state is shared
+    with the previous snapshot and restore() skips them.
+    """
+
+    def __init__(self, main, map_path, hold):
+        self.main = main
+        self.hold = hold
+        self.session = main.GameSession(main.get_window(), map_path, stream=False)
+        level = self.session.level
+        self.dynamic = list(dict.fromkeys(level.resettable + level.animated))
+        self.ends = [obj.rect.center for obj in level.ends]
+        # Saved state each dynamic object was last loaded from or saved as
+        self.current = [self._save(obj) for obj in self.dynamic]
+
+    @staticmethod
+    def _save(obj):
+        state = dict(obj.__dict__)
+        state["rect"] = obj.rect.copy()
+        return state
+
+    @staticmethod
+    def _load(obj, state):
+        attrs = obj.__dict__
+        attrs.clear()
+        attrs.update(state)
+        attrs["rect"] = state["rect"].copy()
+
+    def snapshot(self):
+        session = self.session
+        current = self.current
+        for i, obj in enumerate(self.dynamic):
+            if obj.__dict__ != current[i]:
+                current[i] = self._save(obj)
+        return (dict(session.__dict__), session.clock.ms, self._save(session.player),
+                tuple(current), dict(session.level.scheduler.active))
+
+    def restore(self, snapshot):
+        session_state, ms, player_state, object_states, active = snapshot
+        session = self.session
+        session.__dict__.update(session_state)
+        session.clock.ms = ms
+        self.main.set_clock(session.clock)
+        self._load(session.player, player_state)
+        level = session.level
+        current = self.current
+        for i, obj in enumerate(self.dynamic):
+            state = object_states[i]
+            if obj.__dict__ != state:
+                self._load(obj, state)
+                level.object_restored(obj)
+            current[i] = state
+        level.scheduler.active = dict(active)
+
+    def run(self, action):
+        """Play one action for up to hold ticks; returns (ticks played, status)."""
+        bits = ACTIONS[action][1]
+        session = self.session
+        for tick in range(self.hold):
+            session.step_input(bits if tick == 0 else bits & ~JUMP)
+            if session.level_complete:
+                return tick + 1, COMPLETE
+            if session.dead:
+                return tick + 1, DEAD
+        return self.hold, ALIVE
+
+    def key(self):
+        # Two states with equal keys play out the same (up to the animation
+        # frame, whose mask differs by a pixel or two at most)
+        player = self.session.player
+        changed = 0
+        for i, obj in enumerate(self.dynamic):
+            if getattr(obj, "triggered", False) or getattr(obj, "activated", False) or getattr(obj, "broken", False):
+                changed |= 1 << i
+        return (player.rect.x, player.rect.y, player.y_vel, player.fall_count, player.jump_count,
+                player.direction, player.hit, player.respawn_pos, changed)
+
+    def distance(self):
+        # Heuristic for --beam: how far the player still is from the nearest End
+        x, y = self.session.player.rect.center
+        return min((abs(x - ex) + abs(y - ey) for ex, ey in self.ends), default=0)
+
+    def verify(self, bits):
+        """Replay per-tick input bits in a fresh session; True if it finishes the level."""
+        session = self.main.GameSession(self.main.get_window(), self.session.map_path, stream=False)
+        for tick_bits in bits:
+            session.step_input(tick_bits)
+            if session.level_complete:
+                return True
+        return False
+
+
+def _worker(conn, map_path, hold):
+    os.chdir(ROOT)
+    import main
+
+    sim = Sim(main, map_path, hold)
+    root = sim.snapshot()
+    # node id -> snapshot, for the frontier nodes this worker owns
+    owned = {}
+    conn.send(None)
+    while True:
+        message = conn.recv()
+        if message[0] == "step":
+            _, keep, adopt = message
+            ticks = 0
+            nodes = {}
+            # Survivors of the last step are regenerated from their parent
+            # rather than every child being kept around just in case
+            for node, parent, action in keep:
+                sim.restore(owned[parent])
+                ticks += sim.run(action)[0]
+                nodes[node] = sim.snapshot()
+            # Nodes moved here to balance the load are replayed from the start
+            for node, trace in adopt:
+                sim.restore(root)
+                for action in trace:
+                    ticks += sim.run(action)[0]
+                nodes[node] = sim.snapshot()
+            owned = nodes
+            results = []
+            for node, snapshot in nodes.items():
+                for action in range(len(ACTIONS)):
+                    sim.restore(snapshot)
+                    played, status = sim.run(action)
+                    ticks += played
+                    if status == ALIVE:
+                        results.append((node, action, status, played, sim.key(), sim.distance()))
+                    else:
+                        results.append((node, action, status, played, None, None))
+            conn.send((results, ticks))
+        elif message[0] == "verify":
+            conn.send(sim.verify(message[1]))
+        else:
+            conn.close()
+            return
+
+
+def _trace(parents, node):
+    actions = []
+    while parents[node][0] is not None:
+        node, action = parents[node]
+        actions.append(action)
+    actions.reverse()
+    return actions
+
+
+def _balance(keep, adopt, parents):
+    # Move nodes from busy workers to idle ones once the spread gets large
+    loads = [len(k) + len(a) for k, a in zip(keep, adopt)]
+    target = -(-sum(loads) // len(loads))
+    if max(loads) <= max(1, target * 3 // 2):
+        return
+    for busy in range(len(keep)):
+        while loads[busy] > target and keep[busy]:
+            idle = loads.index(min(loads))
+            if loads[idle] >= target:
+                return
+            node, _, _ = keep[busy].pop()
+            adopt[idle].append((node, _trace(parents, node)))
+            loads[busy] -= 1
+            loads[idle] += 1
+
+
+def solve(map_path, workers=1, hold=6, max_ticks=7200, beam=500, progress=None):
+    """Search map_path for the shortest way to its End; returns a result dict.
+
+    progress, if given, is called with (depth, frontier size, states seen) after every step.
+    """
+    context = multiprocessing.get_context("spawn")
+    pipes = []
+    procs = []
+    for _ in range(workers):
+        parent_end, child_end = context.Pipe()
+        proc = context.Process(target=_worker, args=(child_end, map_path, hold), daemon=True)
+        proc.start()
+        pipes.append(parent_end)
+        procs.append(proc)
+    for conn in pipes:
+        conn.recv()
+
+    started = time.perf_counter()
+    # node id -> (parent node, action); the root has no parent
+    parents = [(None, None)]
+    seen = set()
+    keep = [[] for _ in range(workers)]
+    adopt = [[] for _ in range(workers)]
+    adopt[0].append((0, []))
+    depth = 0
+    ticks = 0
+    pruned = False
+    best = None
+    try:
+        while (any(keep) or any(adopt)) and depth * hold < max_ticks:
+            _balance(keep, adopt, parents)
+            for conn, k, a in zip(pipes, keep, adopt):
+                conn.send(("step", k, a))
+            children = []
+            finished = []
+            for owner, conn in enumerate(pipes):
+                results, worker_ticks = conn.recv()
+                ticks += worker_ticks
+                for node, action, status, played, key, distance in results:
+                    if status == COMPLETE:
+                        finished.append((depth * hold + played, node, action))
+                    elif status == ALIVE and key not in seen:
+                        seen.add(key)
+                        children.append((distance, len(children), owner, node, action))
+            depth += 1
+            if finished:
+                length, node, action = min(finished)
+                best = (length, _trace(parents, node) + [action])
+                break
+            if beam and len(children) > beam:
+                children.sort()
+                del children[beam:]
+                pruned = True
+            keep = [[] for _ in range(workers)]
+            adopt = [[] for _ in range(workers)]
+            for _, _, owner, node, action in sorted(children, key=lambda child: child[1]):
+                parents.append((node, action))
+                keep[owner].append((len(parents) - 1, node, action))
+            if progress is not None:
+                progress(depth, len(children), len(seen))
+        elapsed = time.perf_counter() - started
+
+        result = {
+            "map": map_path,
+            "solvable": best is not None,
+            # Without a solution this is only conclusive if nothing was cut
+            "exhaustive": not pruned and depth * hold < max_ticks,
+            "trace_ticks": best[0] if best else None,
+            "trace": None,
+            "verified": None,
+            "states": len(seen),
+            "depth": depth,
+            "frames": ticks,
+            "seconds": elapsed,
+            "fps": ticks / elapsed if elapsed > 0 else None,
+        }
+        if best is not None:
+            bits = []
+            for action in best[1]:
+                action_bits = ACTIONS[action][1]
+                bits += [action_bits] + [action_bits & ~JUMP] * (hold - 1)
+            bits = bits[:best[0]]
+            result["bits"] = bits
+            # Runs of identical ticks as [input name, ticks]
+            names = {action_bits: name for name, action_bits in ACTIONS}
+            trace = []
+            for tick_bits in bits:
+                if trace and trace[-1][0] == names[tick_bits]:
+                    trace[-1][1] += 1
+                else:
+                    trace.append([names[tick_bits], 1])
+            result["trace"] = trace
+            pipes[0].send(("verify", bits))
+            result["verified"] = pipes[0].recv()
+        return result
+    finally:
+        for conn in pipes:
+            conn.send(("quit",))
+        for proc in procs:
+            proc.join(timeout=10)
+
+
+def level_sequence(first):
+    # first and the LevelN maps main.py moves on to after it
+    import main
+
+    maps = []
+    current = first
+    while current and os.path.exists(current) and current not in maps:
+        maps.append(current)
+        current = main._find_next_level(current)
+    return maps
+
+
+def save_replay(map_path, bits):
+    import main
+
+    recorder = main.InputRecorder(map_path)
+    for tick_bits in bits:
+        recorder.record(tick_bits)
+    path = os.path.splitext(map_path)[0] + ".solution.replay"
+    recorder.save(path)
+    return path
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Check that levels can be finished")
+    parser.add_argument("--map", help="check only this map (default: map/Level1.tmx and the levels after it)")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1, help="search processes")
+    parser.add_argument("--hold", type=int, default=6, help="ticks each bot input is held")
+    parser.add_argument("--max-ticks", type=int, default=7200, help="give up on traces longer than this")
+    parser.add_argument("--beam", type=int, default=500,
+                        help="keep only this many states (closest to the End) per step; 0 keeps all")
+    parser.add_argument("--save-replays", action="store_true",
+                        help="write each solution next to its map as <map>.solution.replay")
+    parser.add_argument("--output", help="also write the results as JSON")
+    parser.add_argument("--verbose", action="store_true", help="print the frontier size after every step")
+    args = parser.parse_args(argv)
+
+    os.chdir(ROOT)
+    maps = [args.map] if args.map else level_sequence(os.path.join("map", "Level1.tmx"))
+    results = []
+    for map_path in maps:
+        progress = None
+        if args.verbose:
+            def progress(depth, frontier, states):
+                print(f"  step {depth}: {frontier} in frontier, {states} states seen", flush=True)
+        result = solve(map_path, max(1, args.workers), args.hold, args.max_ticks, args.beam, progress)
+        if result["solvable"]:
+            runs = " ".join(f"{name}:{ticks}" for name, ticks in result["trace"])
+            status = f"solvable in {result['trace_ticks']} ticks" + ("" if result["verified"] else " (replay FAILED)")
+            if args.save_replays:
+                status += f", saved {save_replay(map_path, result['bits'])}"
+        else:
+            runs = ""
+            status = "NOT solvable" if result["exhaustive"] else "no solution found (search was cut short)"
+        print(f"{map_path}: {status} | {result['states']} states, {result['frames']} frames "
+              f"in {result['seconds']:.1f} s ({result['fps'] or 0:.0f} fps)")
+        if runs:
+            print(f"  trace: {runs}")
+        results.append(result)
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
+    return 0 if all(result["solvable"] and result["verified"] for result in results) else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())